@@ -0,0 +1,103 @@
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+# Token lookups are cached in two tiers: a small per-process LRU with a
+# short TTL, backed by the shared cache with a longer one. Both are cleared
+# by accounts.signals when a token is deleted or replaced and whenever its
+# user is saved (deactivation, password change). Another process's LRU can
+# serve a revoked token for at most TOKEN_LOCAL_CACHE_TIMEOUT seconds, as
+# long as all processes share the cache (settings_prod requires it).
+TOKEN_CACHE_TIMEOUT = getattr(settings, 'TOKEN_CACHE_TIMEOUT', 300)
+TOKEN_LOCAL_CACHE_TIMEOUT = getattr(settings, 'TOKEN_LOCAL_CACHE_TIMEOUT', 10)
+TOKEN_LOCAL_CACHE_SIZE = getattr(settings, 'TOKEN_LOCAL_CACHE_SIZE', 1024)
+
+
+class LRUCache:
+    """Thread-safe LRU mapping whose entries expire after `timeout` seconds."""
+
+    def __init__(self, maxsize, timeout):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_local_tokens = LRUCache(TOKEN_LOCAL_CACHE_SIZE, TOKEN_LOCAL_CACHE_TIMEOUT)
+
+
+def _digest(key):
+    # Raw token keys never end up in cache keys
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def _cache_key(digest):
+    return f'accounts:token:{digest}'
+
+
+def forget_tokens(keys):
+    digests = [_digest(key) for key in keys]
+    for digest in digests:
+        _local_tokens.delete(digest)
+    cache.delete_many([_cache_key(digest) for digest in digests])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication that skips the token/user join for recently seen
+    tokens. Each request gets its own copy of the cached token and user.
+    """
+
+    def authenticate_credentials(self, key):
+        digest = _digest(key)
+        data = _local_tokens.get(digest)
+        if data is None:
+            data = cache.get(_cache_key(digest))
+            if data is None:
+                model = self.get_model()
+                try:
+                    token = model.objects.select_related('user').get(key=key)
+                except model.DoesNotExist:
+                    raise exceptions.AuthenticationFailed(_('Invalid token.'))
+                data = pickle.dumps(token)
+                cache.set(_cache_key(digest), data, TOKEN_CACHE_TIMEOUT)
+            _local_tokens.set(digest, data)
+
+        token = pickle.loads(data)
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        return (token.user, token)
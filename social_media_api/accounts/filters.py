@@ -0,0 +1,20 @@
+from rest_framework import filters
+
+# Longest prefix accepted; usernames are at most 150 characters
+MAX_PREFIX_LENGTH = 150
+
+
+class UsernamePrefixFilter(filters.BaseFilterBackend):
+    """
+    `?q=` matches usernames starting with the given text, ignoring case.
+    On PostgreSQL the lookup is served by accounts_user_username_prefix_idx,
+    an UPPER(username) text_pattern_ops index; MySQL's case-insensitive
+    collation lets it use the unique username index.
+    """
+    search_param = 'q'
+
+    def filter_queryset(self, request, queryset, view):
+        prefix = request.query_params.get(self.search_param, '').strip()[:MAX_PREFIX_LENGTH]
+        if prefix:
+            queryset = queryset.filter(username__istartswith=prefix)
+        return queryset
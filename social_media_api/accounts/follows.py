@@ -0,0 +1,199 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, router, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from .models import User
+
+# followers_count / following_count on User are adjusted together with the
+# follow table. The IDs a user follows are cached per user and dropped
+# whenever that user's follow rows change.
+FOLLOWING_CACHE_TIMEOUT = getattr(settings, 'FOLLOWING_CACHE_TIMEOUT', 3600)
+# Most user IDs accepted by one batch follow/unfollow request
+FOLLOW_BATCH_LIMIT = getattr(settings, 'FOLLOW_BATCH_LIMIT', 200)
+# Largest value of a BigAutoField; larger IDs overflow the raw SQL below
+MAX_USER_ID = 2 ** 63 - 1
+
+# Per-ID outcomes of follow_many() / unfollow_many()
+FOLLOWED = 'followed'
+ALREADY_FOLLOWING = 'already_following'
+UNFOLLOWED = 'unfollowed'
+NOT_FOLLOWING = 'not_following'
+NOT_FOUND = 'not_found'
+SELF = 'self'
+
+Follow = User.followers.through
+
+
+def _key(user_id):
+    return f'accounts:following:{user_id}'
+
+
+def get_following_ids(user_id):
+    """Return the frozenset of IDs `user_id` follows."""
+    ids = cache.get(_key(user_id))
+    if ids is None:
+        ids = frozenset(Follow.objects.filter(to_user_id=user_id).values_list('from_user_id', flat=True))
+        cache.set(_key(user_id), ids, FOLLOWING_CACHE_TIMEOUT)
+    return ids
+
+
+def forget_following_ids(user_ids):
+    cache.delete_many([_key(user_id) for user_id in user_ids])
+
+
+def adjust_follow_counts(follower_id, followee_ids, delta):
+    """Move `follower_id`'s following_count and each followee's followers_count by `delta` per follow."""
+    following = User.objects.filter(pk=follower_id)
+    followees = User.objects.filter(pk__in=followee_ids)
+    if delta < 0:
+        # Never go below zero when the columns have drifted; reconcile fixes them
+        following = following.filter(following_count__gte=-delta * len(followee_ids))
+        followees = followees.filter(followers_count__gte=-delta)
+    following.update(following_count=F('following_count') + delta * len(followee_ids))
+    followees.update(followers_count=F('followers_count') + delta)
+
+
+def follow(follower, followee):
+    """Make `follower` follow `followee`. Returns False if it already did."""
+    with transaction.atomic():
+        _, created = Follow.objects.get_or_create(from_user_id=followee.id, to_user_id=follower.id)
+        if created:
+            adjust_follow_counts(follower.id, [followee.id], 1)
+    forget_following_ids([follower.id])
+    return created
+
+
+def unfollow(follower, followee):
+    """Make `follower` stop following `followee`. Returns False if it did not."""
+    with transaction.atomic():
+        deleted, _ = Follow.objects.filter(from_user_id=followee.id, to_user_id=follower.id).delete()
+        if deleted:
+            adjust_follow_counts(follower.id, [followee.id], -1)
+    forget_following_ids([follower.id])
+    return bool(deleted)
+
+
+def _supports_returning(connection):
+    # INSERT ... ON CONFLICT DO NOTHING RETURNING and DELETE ... RETURNING
+    return connection.vendor in ('postgresql', 'sqlite') and connection.features.can_return_columns_from_insert
+
+
+def _in_clause(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def _columns(connection):
+    return (connection.ops.quote_name(Follow._meta.db_table),
+            connection.ops.quote_name(Follow._meta.get_field('from_user').column),
+            connection.ops.quote_name(Follow._meta.get_field('to_user').column))
+
+
+def _insert_follows(connection, follower_id, user_ids):
+    """Insert the missing follow rows; returns the IDs that were newly followed."""
+    if _supports_returning(connection):
+        table, followee, follower = _columns(connection)
+        with connection.cursor() as cursor:
+            cursor.execute(f'INSERT INTO {table} ({followee}, {follower}) '
+                           f'VALUES {", ".join(["(%s, %s)"] * len(user_ids))} '
+                           f'ON CONFLICT ({followee}, {follower}) DO NOTHING RETURNING {followee}',
+                           [param for user_id in user_ids for param in (user_id, follower_id)])
+            return {row[0] for row in cursor.fetchall()}
+    # MySQL: compare before and after within the transaction's snapshot, so
+    # rows another request inserted concurrently are not counted as ours
+    rows = Follow.objects.filter(from_user_id__in=user_ids, to_user_id=follower_id)
+    existing = set(rows.values_list('from_user_id', flat=True))
+    Follow.objects.bulk_create(
+        [Follow(from_user_id=user_id, to_user_id=follower_id) for user_id in user_ids if user_id not in existing],
+        ignore_conflicts=True,
+    )
+    return set(rows.values_list('from_user_id', flat=True)) - existing
+
+
+def _delete_follows(connection, follower_id, user_ids):
+    """Delete the follower's rows for `user_ids`; returns the IDs that were unfollowed."""
+    if _supports_returning(connection):
+        table, followee, follower = _columns(connection)
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {table} WHERE {follower} = %s AND {followee} IN ({_in_clause(user_ids)}) '
+                           f'RETURNING {followee}', [follower_id, *user_ids])
+            return {row[0] for row in cursor.fetchall()}
+    rows = Follow.objects.filter(from_user_id__in=user_ids, to_user_id=follower_id)
+    deleted = set(rows.select_for_update().values_list('from_user_id', flat=True))
+    rows.filter(from_user_id__in=deleted).delete()
+    return deleted
+
+
+def _partition(follower, user_ids):
+    """Split `user_ids` into (results for unusable IDs, the IDs of other existing users)."""
+    results = {}
+    user_ids = list(dict.fromkeys(user_ids))
+    existing = set(User.objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+    for user_id in user_ids:
+        if user_id == follower.id:
+            results[user_id] = SELF
+        elif user_id not in existing:
+            results[user_id] = NOT_FOUND
+    return results, [user_id for user_id in user_ids if user_id not in results]
+
+
+def follow_many(follower, user_ids):
+    """
+    Follow every user in `user_ids` with one insert. Returns
+    {user_id: outcome}; the IDs with outcome FOLLOWED are newly followed.
+
+    Outcomes and counters come from the rows this call actually inserted,
+    so repeated or concurrent batches never count a follow twice.
+    """
+    results, candidates = _partition(follower, user_ids)
+    if candidates:
+        connection = connections[router.db_for_write(Follow)]
+        with transaction.atomic(using=connection.alias):
+            inserted = _insert_follows(connection, follower.id, candidates)
+            if inserted:
+                adjust_follow_counts(follower.id, sorted(inserted), 1)
+        forget_following_ids([follower.id])
+        results.update({user_id: FOLLOWED if user_id in inserted else ALREADY_FOLLOWING for user_id in candidates})
+    return results
+
+
+def unfollow_many(follower, user_ids):
+    """Unfollow every user in `user_ids` with one delete. Returns {user_id: outcome}."""
+    results, candidates = _partition(follower, user_ids)
+    if candidates:
+        connection = connections[router.db_for_write(Follow)]
+        with transaction.atomic(using=connection.alias):
+            deleted = _delete_follows(connection, follower.id, candidates)
+            if deleted:
+                adjust_follow_counts(follower.id, sorted(deleted), -1)
+        forget_following_ids([follower.id])
+        results.update({user_id: UNFOLLOWED if user_id in deleted else NOT_FOLLOWING for user_id in candidates})
+    return results
+
+
+def _count_subquery(field, group_by):
+    counts = (Follow.objects.filter(**{field: OuterRef('pk')})
+              .order_by().values(group_by).annotate(total=Count('pk')).values('total'))
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def reconcile_follow_counts(queryset=None):
+    """
+    Recompute followers_count and following_count for users whose stored
+    values drifted from the follow table. Returns the number of fixed users.
+    """
+    if queryset is None:
+        queryset = User.objects.all()
+    followers = _count_subquery('from_user', 'from_user')
+    following = _count_subquery('to_user', 'to_user')
+    drifted_ids = list(queryset.annotate(
+        actual_followers=followers,
+        actual_following=following,
+    ).exclude(
+        followers_count=F('actual_followers'),
+        following_count=F('actual_following'),
+    ).values_list('pk', flat=True))
+
+    if drifted_ids:
+        User.objects.filter(pk__in=drifted_ids).update(followers_count=followers, following_count=following)
+    return len(drifted_ids)
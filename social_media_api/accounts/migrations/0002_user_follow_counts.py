@@ -0,0 +1,38 @@
+# Generated by Django 5.1.15 on 2026-10-18 16:59
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_counts(apps, schema_editor):
+    User = apps.get_model('accounts', 'User')
+    Follow = User.followers.through
+
+    def count_of(field):
+        counts = (Follow.objects.filter(**{field: OuterRef('pk')})
+                  .order_by().values(field).annotate(total=Count('pk')).values('total'))
+        return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+    User.objects.update(followers_count=count_of('from_user'), following_count=count_of('to_user'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.15 on 2026-10-18 17:07
+
+from django.db import migrations
+
+# Django compiles username__istartswith on PostgreSQL to
+# UPPER("username"::text) LIKE UPPER(%s); this expression index with
+# text_pattern_ops serves it regardless of the database collation.
+# Other backends use the unique username index.
+CREATE_INDEX = (
+    'CREATE INDEX IF NOT EXISTS accounts_user_username_prefix_idx '
+    'ON accounts_user (UPPER(username::text) text_pattern_ops)'
+)
+DROP_INDEX = 'DROP INDEX IF EXISTS accounts_user_username_prefix_idx'
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_INDEX)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_user_follow_counts'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
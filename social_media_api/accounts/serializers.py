@@ -2,13 +2,14 @@ from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
 from rest_framework.authtoken.models import Token
+from .follows import FOLLOW_BATCH_LIMIT, MAX_USER_ID
 
 User = get_user_model()
 
 class UserSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=True, validators=[validate_password])
     password2 = serializers.CharField(write_only=True, required=True)
-    token = serializers.CharField()
+    token = serializers.CharField(read_only=True)
 
     class Meta:
         model = User
@@ -35,17 +36,15 @@ class UserSerializer(serializers.ModelSerializer):
         return user
 
 class UserProfileSerializer(serializers.ModelSerializer):
-    followers_count = serializers.SerializerMethodField()
-    following_count = serializers.SerializerMethodField()
-
     class Meta:
         model = User
         fields = ('id', 'username', 'email', 'first_name', 'last_name', 'bio', 
                  'profile_picture', 'followers_count', 'following_count')
-        read_only_fields = ('email',)
-
-    def get_followers_count(self, obj):
-        return obj.followers.count()
-
-    def get_following_count(self, obj):
-        return obj.following.count()
\ No newline at end of file
+        read_only_fields = ('email', 'followers_count', 'following_count')
+
+class UserIdListSerializer(serializers.Serializer):
+    user_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1, max_value=MAX_USER_ID),
+        allow_empty=False,
+        max_length=FOLLOW_BATCH_LIMIT,
+    )
@@ -0,0 +1,42 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from .authentication import forget_tokens
+from .follows import Follow, forget_following_ids
+from .models import User
+
+
+@receiver(m2m_changed, sender=Follow)
+def forget_cached_following(sender, instance, action, reverse, pk_set, **kwargs):
+    # Follows changed through the ORM (user.following.add() and friends)
+    # rather than accounts.follows still drop the cached following sets.
+    # Counters are not adjusted here; reconcile_follow_counts repairs them.
+    if reverse:
+        # instance.following changed: instance is the follower
+        if action.startswith('post_'):
+            forget_following_ids([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        forget_following_ids(pk_set)
+    elif action == 'pre_clear':
+        forget_following_ids(instance.followers.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def forget_cached_token(sender, instance, **kwargs):
+    forget_tokens([instance.key])
+    # Also after commit, in case a concurrent request re-cached the old row
+    transaction.on_commit(lambda: forget_tokens([instance.key]))
+
+
+@receiver(post_save, sender=User)
+def forget_cached_user_tokens(sender, instance, created, raw=False, **kwargs):
+    # The cached token carries the user, so any change to it (deactivation,
+    # a new password, profile edits) must drop the cached copies
+    if created or raw:
+        return
+    keys = list(Token.objects.filter(user_id=instance.pk).values_list('key', flat=True))
+    if keys:
+        forget_tokens(keys)
+        transaction.on_commit(lambda: forget_tokens(keys))
@@ -3,12 +3,19 @@ from django.urls import reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
 from django.contrib.auth import get_user_model
-from posts.models import Post
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from accounts.authentication import _local_tokens
+from accounts.follows import _key, follow, get_following_ids, reconcile_follow_counts
+from posts.models import FeedEntry, Post
 
 User = get_user_model()
 
 class FollowSystemTests(APITestCase):
     def setUp(self):
+        cache.clear()
         # Create test users
         self.user1 = User.objects.create_user(username='testuser1', password='testpass123')
         self.user2 = User.objects.create_user(username='testuser2', password='testpass123')
@@ -34,6 +41,198 @@ class FollowSystemTests(APITestCase):
         response = self.client.post(url)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+class FollowCountTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user1 = User.objects.create_user(username='testuser1', password='testpass123')
+        self.user2 = User.objects.create_user(username='testuser2', password='testpass123')
+        self.client.force_authenticate(user=self.user1)
+
+    def test_counts_follow_and_unfollow(self):
+        self.client.post(reverse('follow-user', kwargs={'user_id': self.user2.id}))
+        self.client.post(reverse('follow-user', kwargs={'user_id': self.user2.id}))
+        self.user1.refresh_from_db()
+        self.user2.refresh_from_db()
+        self.assertEqual((self.user1.following_count, self.user2.followers_count), (1, 1))
+
+        self.client.post(reverse('unfollow-user', kwargs={'user_id': self.user2.id}))
+        self.client.post(reverse('unfollow-user', kwargs={'user_id': self.user2.id}))
+        self.user1.refresh_from_db()
+        self.user2.refresh_from_db()
+        self.assertEqual((self.user1.following_count, self.user2.followers_count), (0, 0))
+
+    def test_profile_reads_counter_columns(self):
+        User.objects.filter(pk=self.user1.pk).update(followers_count=7)
+        self.user1.refresh_from_db()
+        self.client.force_authenticate(user=self.user1)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('profile'))
+        self.assertEqual(response.data['followers_count'], 7)
+        self.assertEqual(len(queries), 1)
+
+    def test_following_ids_are_cached_and_invalidated(self):
+        self.assertEqual(get_following_ids(self.user1.id), frozenset())
+        with CaptureQueriesContext(connection) as queries:
+            get_following_ids(self.user1.id)
+        self.assertEqual(len(queries), 0)
+
+        self.user1.following.add(self.user2)
+        self.assertEqual(get_following_ids(self.user1.id), {self.user2.id})
+        self.user2.followers.clear()
+        self.assertEqual(get_following_ids(self.user1.id), frozenset())
+
+    def test_reconcile_fixes_drift(self):
+        self.user1.following.add(self.user2)
+        self.assertEqual(reconcile_follow_counts(), 2)
+        self.user2.refresh_from_db()
+        self.assertEqual(self.user2.followers_count, 1)
+        self.assertEqual(reconcile_follow_counts(), 0)
+
+class UserDirectoryTests(APITestCase):
+    def setUp(self):
+        for name in ['alice', 'Albert', 'bob', 'carol', 'alfred']:
+            User.objects.create_user(username=name, password='testpass123')
+        self.client.force_authenticate(user=User.objects.get(username='bob'))
+
+    def test_directory_is_cursor_paginated_by_username(self):
+        response = self.client.get(reverse('user-list'), {'page_size': 2})
+        self.assertEqual([u['username'] for u in response.data['results']], ['Albert', 'alfred'])
+        self.assertNotIn('count', response.data)
+        response = self.client.get(response.data['next'])
+        self.assertEqual([u['username'] for u in response.data['results']], ['alice', 'bob'])
+
+    def test_prefix_search_ignores_case(self):
+        response = self.client.get(reverse('user-list'), {'q': 'AL'})
+        self.assertEqual([u['username'] for u in response.data['results']], ['Albert', 'alfred', 'alice'])
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(reverse('user-list'), {'page_size': 1})
+        with CaptureQueriesContext(connection) as large:
+            self.client.get(reverse('user-list'), {'page_size': 5})
+        self.assertEqual(len(small), len(large))
+
+class BatchFollowTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='importer', password='testpass123')
+        self.others = [User.objects.create_user(username=f'contact{i}', password='testpass123') for i in range(3)]
+        self.post = Post.objects.create(author=self.others[0], title='Hello', content='Content')
+        self.client.force_authenticate(user=self.user)
+
+    def statuses(self, response):
+        return {result['user_id']: result['status'] for result in response.data['results']}
+
+    def test_batch_follow_reports_each_id(self):
+        self.client.post(reverse('follow-user', kwargs={'user_id': self.others[1].id}))
+        ids = [self.others[0].id, self.others[1].id, self.others[2].id, self.user.id, 999999]
+        response = self.client.post(reverse('follow-batch'), {'user_ids': ids}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.statuses(response), {
+            self.others[0].id: 'followed', self.others[1].id: 'already_following',
+            self.others[2].id: 'followed', self.user.id: 'self', 999999: 'not_found',
+        })
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.following_count, 3)
+        self.assertEqual(set(get_following_ids(self.user.id)), {u.id for u in self.others})
+        self.assertEqual(reconcile_follow_counts(), 0)
+        self.assertTrue(FeedEntry.objects.filter(user=self.user, post=self.post).exists())
+
+    def test_batch_follow_query_count_is_flat(self):
+        for other in self.others[1:]:
+            Post.objects.create(author=other, title='Hello', content='Content')
+        with CaptureQueriesContext(connection) as one:
+            self.client.post(reverse('follow-batch'), {'user_ids': [self.others[0].id]}, format='json')
+        with CaptureQueriesContext(connection) as many:
+            self.client.post(reverse('follow-batch'), {'user_ids': [u.id for u in self.others[1:]]}, format='json')
+        self.assertEqual(len(one), len(many))
+
+    def test_batch_unfollow(self):
+        self.client.post(reverse('follow-batch'), {'user_ids': [self.others[0].id, self.others[1].id]}, format='json')
+        response = self.client.post(reverse('unfollow-batch'),
+                                    {'user_ids': [self.others[0].id, self.others[2].id]}, format='json')
+        self.assertEqual(self.statuses(response), {self.others[0].id: 'unfollowed', self.others[2].id: 'not_following'})
+        self.assertEqual(reconcile_follow_counts(), 0)
+        self.assertFalse(FeedEntry.objects.filter(user=self.user).exists())
+
+    def test_counts_follow_the_rows_actually_written(self):
+        ids = [self.others[0].id, self.others[1].id]
+        follow(self.user, self.others[0])
+        # The cached following set has not caught up with that follow yet
+        cache.set(_key(self.user.id), frozenset())
+        response = self.client.post(reverse('follow-batch'), {'user_ids': ids}, format='json')
+        self.assertEqual(self.statuses(response), {self.others[0].id: 'already_following',
+                                                   self.others[1].id: 'followed'})
+        self.client.post(reverse('follow-batch'), {'user_ids': ids}, format='json')
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.following_count, 2)
+
+        response = self.client.post(reverse('unfollow-batch'), {'user_ids': ids}, format='json')
+        self.assertEqual(self.statuses(response), {self.others[0].id: 'unfollowed', self.others[1].id: 'unfollowed'})
+        self.client.post(reverse('unfollow-batch'), {'user_ids': ids}, format='json')
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.following_count, 0)
+
+    def test_batch_size_is_limited(self):
+        response = self.client.post(reverse('follow-batch'), {'user_ids': list(range(1, 300))}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_out_of_range_ids_are_rejected(self):
+        for name in ('follow-batch', 'unfollow-batch'):
+            response = self.client.post(reverse(name), {'user_ids': [2 ** 70]}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class RegistrationTests(APITestCase):
+    def test_register_returns_a_token(self):
+        response = self.client.post(reverse('register'), {
+            'username': 'newcomer', 'email': 'newcomer@example.com',
+            'password': 'c0mplex-Pass', 'password2': 'c0mplex-Pass',
+        })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['token'], Token.objects.get(user__username='newcomer').key)
+
+class CachedTokenAuthenticationTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        _local_tokens.clear()
+        self.user = User.objects.create_user(username='cached', password='testpass123')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def token_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('user-list'))
+        return response, [q for q in queries.captured_queries if 'authtoken_token' in q['sql']]
+
+    def test_repeat_requests_skip_the_token_lookup(self):
+        response, first = self.token_queries()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(first), 1)
+        _local_tokens.clear()
+        _, shared = self.token_queries()
+        _, local = self.token_queries()
+        self.assertEqual((len(shared), len(local)), (0, 0))
+
+    def test_deleted_token_is_rejected(self):
+        self.token_queries()
+        self.token.delete()
+        response, _ = self.token_queries()
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_is_rejected(self):
+        self.token_queries()
+        self.user.is_active = False
+        self.user.save()
+        response, _ = self.token_queries()
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_change_drops_cached_token(self):
+        self.token_queries()
+        self.user.set_password('newpass456')
+        self.user.save()
+        _, queries = self.token_queries()
+        self.assertEqual(len(queries), 1)
+
 class FeedTests(APITestCase):
     def setUp(self):
         # Create test users
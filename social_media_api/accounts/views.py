@@ -4,25 +4,30 @@ from rest_framework.authtoken.models import Token
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.shortcuts import get_object_or_404
-from .serializers import UserSerializer, UserProfileSerializer
+from posts.feed import backfill_feed, backfill_feed_many, prune_feed, prune_feed_many
+from social_media_api.pagination import UserDirectoryPagination
+from .filters import UsernamePrefixFilter
+from .follows import FOLLOWED, UNFOLLOWED, follow, follow_many, get_following_ids, unfollow, unfollow_many
+from .serializers import UserSerializer, UserProfileSerializer, UserIdListSerializer
 from .models import User as CustomUser
 
-class UserListView(generics.GenericAPIView):
+class UserListView(generics.ListAPIView):
+    """User directory, cursor-paginated by username and searchable by prefix."""
     serializer_class = UserProfileSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = UserDirectoryPagination
+    filter_backends = [UsernamePrefixFilter]
+    query_budget = 1
 
     def get_queryset(self):
-        return CustomUser.objects.all()
-
-    def get(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        # Counts come from the denormalized columns, so no per-user queries
+        return CustomUser.objects.order_by(*self.pagination_class.ordering)
 
 class RegisterView(generics.CreateAPIView):
     queryset = CustomUser.objects.all()
     serializer_class = UserSerializer
     permission_classes = (permissions.AllowAny,)
+    query_budget = 4
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -36,6 +41,8 @@ class RegisterView(generics.CreateAPIView):
         }, status=status.HTTP_201_CREATED)
 
 class CustomLoginView(ObtainAuthToken):
+    query_budget = 5
+
     def post(self, request, *args, **kwargs):
         serializer = self.serializer_class(data=request.data,
                                          context={'request': request})
@@ -51,12 +58,16 @@ class CustomLoginView(ObtainAuthToken):
 class UserProfileView(generics.RetrieveUpdateAPIView):
     serializer_class = UserProfileSerializer
     permission_classes = (permissions.IsAuthenticated,)
+    query_budget = 3
 
     def get_object(self):
-        return self.request.user
+        # request.user may come from the token cache; read the current row
+        # so the follow counters are fresh
+        return CustomUser.objects.get(pk=self.request.user.pk)
 
 class FollowUserView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    query_budget = 12
 
     def post(self, request, user_id):
         user_to_follow = get_object_or_404(CustomUser, id=user_id)
@@ -65,8 +76,8 @@ class FollowUserView(APIView):
                 {'error': 'You cannot follow yourself.'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
-        if not request.user.following.filter(id=user_to_follow.id).exists():
-            request.user.following.add(user_to_follow)
+        if user_to_follow.id not in get_following_ids(request.user.id) and follow(request.user, user_to_follow):
+            backfill_feed(request.user, user_to_follow)
             return Response(
                 {'message': f'You are now following {user_to_follow.username}'},
                 status=status.HTTP_200_OK
@@ -78,6 +89,7 @@ class FollowUserView(APIView):
 
 class UnfollowUserView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    query_budget = 8
 
     def post(self, request, user_id):
         user_to_unfollow = get_object_or_404(CustomUser, id=user_id)
@@ -86,8 +98,8 @@ class UnfollowUserView(APIView):
                 {'error': 'You cannot unfollow yourself.'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
-        if request.user.following.filter(id=user_to_unfollow.id).exists():
-            request.user.following.remove(user_to_unfollow)
+        if user_to_unfollow.id in get_following_ids(request.user.id) and unfollow(request.user, user_to_unfollow):
+            prune_feed(request.user, user_to_unfollow)
             return Response(
                 {'message': f'You have unfollowed {user_to_unfollow.username}'},
                 status=status.HTTP_200_OK
@@ -96,3 +108,37 @@ class UnfollowUserView(APIView):
             {'message': f'You are not following {user_to_unfollow.username}'},
             status=status.HTTP_400_BAD_REQUEST
         )
+
+class BatchFollowView(APIView):
+    """Follow up to FOLLOW_BATCH_LIMIT users at once, e.g. after a contact import."""
+    permission_classes = [permissions.IsAuthenticated]
+    done_status = FOLLOWED
+    query_budget = 9
+
+    def apply(self, user, user_ids):
+        return follow_many(user, user_ids)
+
+    def update_feed(self, user, author_ids):
+        backfill_feed_many(user, author_ids)
+
+    def post(self, request):
+        serializer = UserIdListSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user_ids = list(dict.fromkeys(serializer.validated_data['user_ids']))
+
+        outcomes = self.apply(request.user, user_ids)
+        self.update_feed(request.user, [user_id for user_id in user_ids if outcomes[user_id] == self.done_status])
+        return Response({
+            'results': [{'user_id': user_id, 'status': outcomes[user_id]} for user_id in user_ids],
+        }, status=status.HTTP_200_OK)
+
+class BatchUnfollowView(BatchFollowView):
+    """Unfollow up to FOLLOW_BATCH_LIMIT users at once."""
+    done_status = UNFOLLOWED
+    query_budget = 8
+
+    def apply(self, user, user_ids):
+        return unfollow_many(user, user_ids)
+
+    def update_feed(self, user, author_ids):
+        prune_feed_many(user, author_ids)
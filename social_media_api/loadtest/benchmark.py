@@ -0,0 +1,184 @@
+import json
+import math
+import platform
+import time
+import urllib.error
+import urllib.request
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from notifications.models import Notification
+from posts.fastpath import FAST_SERIALIZATION
+from posts.likes import unlike_posts
+from posts.models import Comment, Like, Post
+
+# Replays the API's hot read and write paths and reports latency
+# percentiles, queries per request and payload size as JSON, so runs can be
+# diffed between releases.
+
+User = get_user_model()
+
+SCENARIOS = ('feed', 'posts_list', 'posts_retrieve', 'posts_search', 'like', 'notifications')
+HOT_POSTS = 20
+
+
+class ClientTransport:
+    """Requests through Django's test client, in process; counts queries."""
+    name = 'test-client'
+
+    def __init__(self, token):
+        self.client = Client(HTTP_AUTHORIZATION=f'Token {token}')
+
+    def request(self, method, path):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = getattr(self.client, method.lower())(path, secure=True)
+            content = b''.join(response) if response.streaming else response.content
+            elapsed = time.perf_counter() - started
+        return response.status_code, len(content), elapsed, len(queries)
+
+
+class HTTPTransport:
+    """Requests against a running server; queries per request are unknown."""
+    name = 'http'
+
+    def __init__(self, token, base_url):
+        self.headers = {'Authorization': f'Token {token}'}
+        self.base_url = base_url.rstrip('/')
+
+    def request(self, method, path):
+        request = urllib.request.Request(self.base_url + path, method=method, headers=self.headers)
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request) as response:
+                status, content = response.status, response.read()
+        except urllib.error.HTTPError as error:
+            status, content = error.code, error.read()
+        return status, len(content), time.perf_counter() - started, None
+
+
+def percentile(sorted_values, fraction):
+    """Linear-interpolated percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * fraction
+    lower, upper = math.floor(position), math.ceil(position)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def summarize(values, digits=3):
+    values = sorted(value for value in values if value is not None)
+    if not values:
+        return None
+    return {
+        'p50': round(percentile(values, 0.50), digits),
+        'p95': round(percentile(values, 0.95), digits),
+        'p99': round(percentile(values, 0.99), digits),
+        'mean': round(sum(values) / len(values), digits),
+        'max': round(values[-1], digits),
+    }
+
+
+class Benchmark:
+    def __init__(self, user, requests=200, warmup=10, page_size=None, search_term='python',
+                 scenarios=SCENARIOS, base_url=None, cold=False):
+        self.user = user
+        self.cold = cold
+        self.requests = requests
+        self.warmup = warmup
+        self.page_size = page_size
+        self.search_term = search_term
+        self.scenarios = scenarios
+        token, _ = Token.objects.get_or_create(user=user)
+        self.transport = HTTPTransport(token.key, base_url) if base_url else ClientTransport(token.key)
+        self.hot_posts = list(Post.objects.order_by('-likes_count', '-id').values_list('pk', flat=True)[:HOT_POSTS])
+        # Hot posts the user has not liked yet, so every like inserts a row
+        liked = set(Like.objects.filter(user=user, post__in=self.hot_posts).values_list('post_id', flat=True))
+        self.liked_before = liked
+        self.like_targets = [post_id for post_id in self.hot_posts if post_id not in liked] or self.hot_posts
+
+    def with_page_size(self, path):
+        return f'{path}?page_size={self.page_size}' if self.page_size else path
+
+    def calls(self, scenario, n):
+        """The (method, path) of the n-th request of a scenario."""
+        post_id = self.hot_posts[n % len(self.hot_posts)] if self.hot_posts else 0
+        if scenario == 'feed':
+            return 'GET', self.with_page_size(reverse('feed'))
+        if scenario == 'posts_list':
+            return 'GET', self.with_page_size(reverse('post-list'))
+        if scenario == 'posts_retrieve':
+            return 'GET', reverse('post-detail', kwargs={'pk': post_id})
+        if scenario == 'posts_search':
+            return 'GET', f"{reverse('post-list')}?q={self.search_term}"
+        if scenario == 'like':
+            # Like then unlike each target in turn
+            post_id = self.like_targets[(n // 2) % len(self.like_targets)] if self.like_targets else 0
+            return ('POST' if n % 2 == 0 else 'DELETE'), reverse('post-like', kwargs={'pk': post_id})
+        if scenario == 'notifications':
+            return 'GET', self.with_page_size(reverse('notification-list'))
+        raise ValueError(f'Unknown scenario: {scenario}')
+
+    def run_scenario(self, scenario):
+        if self.cold:
+            cache.clear()
+        for n in range(self.warmup):
+            self.transport.request(*self.calls(scenario, n))
+        statuses, latencies, queries, sizes = {}, [], [], []
+        for n in range(self.requests):
+            status, size, elapsed, query_count = self.transport.request(*self.calls(scenario, n))
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+            latencies.append(elapsed * 1000)
+            queries.append(query_count)
+            sizes.append(size)
+        if scenario == 'like':
+            # An odd number of requests leaves the last like behind
+            unlike_posts(self.user, [post_id for post_id in self.like_targets
+                                     if post_id not in self.liked_before])
+        return {
+            'requests': self.requests,
+            'status': statuses,
+            'latency_ms': summarize(latencies),
+            'queries': summarize(queries, digits=1),
+            'bytes': summarize(sizes, digits=0),
+        }
+
+    def metadata(self):
+        return {
+            'started_at': timezone.now().isoformat(),
+            'django': django.get_version(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'transport': self.transport.name,
+            'user': self.user.username,
+            'requests': self.requests,
+            'warmup': self.warmup,
+            'page_size': self.page_size,
+            'cold': self.cold,
+            'cache': settings.CACHES['default']['BACKEND'],
+            'fast_serialization': FAST_SERIALIZATION,
+            'rows': {
+                'users': User.objects.count(),
+                'posts': Post.objects.count(),
+                'comments': Comment.objects.count(),
+                'likes': Like.objects.count(),
+                'notifications': Notification.objects.count(),
+            },
+        }
+
+    def run(self):
+        report = {'meta': self.metadata(), 'scenarios': {}}
+        for scenario in self.scenarios:
+            report['scenarios'][scenario] = self.run_scenario(scenario)
+        return report
+
+
+def dumps(report):
+    return json.dumps(report, indent=2, sort_keys=True)
@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_test_environment, teardown_test_environment
+from loadtest.benchmark import SCENARIOS, Benchmark, dumps
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Replays the hot API endpoints and reports latency, query and payload percentiles as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Username to authenticate as (default: the most followed seeded user)')
+        parser.add_argument('--requests', type=int, default=200, help='Measured requests per scenario')
+        parser.add_argument('--warmup', type=int, default=10, help='Unmeasured requests per scenario')
+        parser.add_argument('--page-size', type=int)
+        parser.add_argument('--scenario', action='append', dest='scenarios', choices=SCENARIOS,
+                            help='Run only this scenario (repeatable)')
+        parser.add_argument('--search-term', default='python')
+        parser.add_argument('--base-url', help='Benchmark a running server instead of the in-process test client')
+        parser.add_argument('--cold', action='store_true', help='Clear the cache before each scenario')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+
+    def get_user(self, username):
+        users = User.objects.all()
+        if username:
+            users = users.filter(username=username)
+        user = users.order_by('-following_count', 'pk').first()
+        if user is None:
+            raise CommandError(f'No such user: {username}' if username else 'No users; run seed_data first')
+        return user
+
+    def handle(self, *args, **options):
+        benchmark = Benchmark(
+            self.get_user(options['user']), requests=options['requests'], warmup=options['warmup'],
+            page_size=options['page_size'], search_term=options['search_term'],
+            scenarios=options['scenarios'] or SCENARIOS, base_url=options['base_url'], cold=options['cold'],
+        )
+
+        # The test client needs 'testserver' in ALLOWED_HOSTS
+        in_process = not options['base_url'] and 'testserver' not in settings.ALLOWED_HOSTS
+        if in_process:
+            setup_test_environment(debug=settings.DEBUG)
+        try:
+            report = benchmark.run()
+        finally:
+            if in_process:
+                teardown_test_environment()
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(dumps(report))
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+        else:
+            self.stdout.write(dumps(report))
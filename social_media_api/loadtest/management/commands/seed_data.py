@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from loadtest.seed import DEFAULT_BATCH_SIZE, SEED_PASSWORD, Seeder
+
+
+class Command(BaseCommand):
+    help = 'Fills the database with power-law distributed synthetic users, posts and activity'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument('--likes', type=int, default=50000)
+        parser.add_argument('--follows', type=int, default=20, help='Mean number of accounts each user follows')
+        parser.add_argument('--notifications', type=int, default=20000)
+        parser.add_argument('--alpha', type=float, default=1.1,
+                            help='Power-law exponent; higher values concentrate activity on fewer users and posts')
+        parser.add_argument('--days', type=int, default=30, help='Spread timestamps over this many days')
+        parser.add_argument('--prefix', default='seed', help='Username prefix of the generated users')
+        parser.add_argument('--seed', type=int, help='Random seed, for reproducible data sets')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--skip-feeds', action='store_true', help='Do not rebuild the seeded users\' feeds')
+
+    def handle(self, *args, **options):
+        seeder = Seeder(
+            users=options['users'], posts=options['posts'], comments=options['comments'],
+            likes=options['likes'], follows=options['follows'], notifications=options['notifications'],
+            alpha=options['alpha'], days=options['days'], prefix=options['prefix'], seed=options['seed'],
+            batch_size=options['batch_size'], build_feeds=not options['skip_feeds'], log=self.stdout.write,
+        )
+        with transaction.atomic():
+            counts = seeder.run()
+        summary = ', '.join(f'{count} {name}' for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f'Seeded {summary}'))
+        self.stdout.write(f"Users log in as {options['prefix']}_<n> with password {SEED_PASSWORD!r}")
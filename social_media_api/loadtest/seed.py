@@ -0,0 +1,187 @@
+import bisect
+import itertools
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from io import StringIO
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.utils import timezone
+from accounts.follows import Follow
+from notifications.models import Notification
+from posts.cache import invalidate_post_list
+from posts.feed import rebuild_feed
+from posts.models import Comment, Like, Post
+
+# Synthetic data for load tests. Popularity follows a power law: user i
+# (1-based) is picked as an author, followee or notification recipient with
+# weight 1 / i**alpha, and post j with weight 1 / j**alpha, so a few
+# accounts and posts draw most of the activity, as in production.
+
+User = get_user_model()
+
+DEFAULT_BATCH_SIZE = 5000
+SEED_PASSWORD = 'seed-password'
+WORDS = (
+    'python django api feed post like comment follow cache query index latency '
+    'coffee travel music photo weekend launch release team design review data '
+    'search stream notify profile friend city game movie book summer winter'
+).split()
+VERBS = ('liked', 'commented on')
+
+
+class PowerLaw:
+    """Samples ids with weight 1 / rank**alpha; ranks follow the order of `ids`."""
+
+    def __init__(self, ids, alpha, rng):
+        self.ids = list(ids)
+        self.rng = rng
+        self.cumulative = list(itertools.accumulate(1 / (rank ** alpha) for rank in range(1, len(self.ids) + 1)))
+
+    def sample(self):
+        point = self.rng.random() * self.cumulative[-1]
+        return self.ids[min(bisect.bisect_left(self.cumulative, point), len(self.ids) - 1)]
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let bulk_create keep the created_at/updated_at values we generate."""
+    fields = [field for model in models for field in model._meta.concrete_fields
+              if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def bulk_insert(model, objects, batch_size, ignore_conflicts=False):
+    """bulk_create `objects` (any iterable) in batches; returns the number handed to the database."""
+    total = 0
+    iterator = iter(objects)
+    while batch := list(itertools.islice(iterator, batch_size)):
+        model.objects.bulk_create(batch, batch_size=batch_size, ignore_conflicts=ignore_conflicts)
+        total += len(batch)
+    return total
+
+
+class Seeder:
+    def __init__(self, users=1000, posts=10000, comments=20000, likes=50000, follows=20,
+                 notifications=20000, alpha=1.1, days=30, prefix='seed', seed=None,
+                 batch_size=DEFAULT_BATCH_SIZE, build_feeds=True, log=None):
+        self.counts = {'users': users, 'posts': posts, 'comments': comments, 'likes': likes,
+                       'notifications': notifications}
+        self.follows = follows
+        self.alpha = alpha
+        self.days = days
+        self.prefix = prefix
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        self.build_feeds = build_feeds
+        self.log = log or (lambda message: None)
+        self.now = timezone.now()
+
+    def text(self, words):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(words))
+
+    def moment(self, after=None):
+        start = after or self.now - timedelta(days=self.days)
+        return start + (self.now - start) * self.rng.random()
+
+    def create_users(self):
+        offset = User.objects.filter(username__startswith=f'{self.prefix}_').count()
+        password = make_password(SEED_PASSWORD)
+        bulk_insert(User, (
+            User(username=f'{self.prefix}_{offset + n}', email=f'{self.prefix}_{offset + n}@example.com',
+                 password=password, bio=self.text(8))
+            for n in range(self.counts['users'])
+        ), self.batch_size)
+        return list(User.objects.filter(username__startswith=f'{self.prefix}_')
+                    .order_by('pk').values_list('pk', flat=True)[offset:])
+
+    def create_follows(self, user_ids, popular):
+        def edges():
+            for follower_id in user_ids:
+                # Out-degree is power-law distributed around the requested mean
+                degree = min(len(user_ids) - 1, max(1, int(self.rng.paretovariate(2) * self.follows / 2)))
+                followees = {popular.sample() for _ in range(degree)} - {follower_id}
+                for followee_id in followees:
+                    yield Follow(from_user_id=followee_id, to_user_id=follower_id)
+        return bulk_insert(Follow, edges(), self.batch_size, ignore_conflicts=True)
+
+    def create_posts(self, popular):
+        with explicit_timestamps(Post):
+            def posts():
+                for _ in range(self.counts['posts']):
+                    created = self.moment()
+                    yield Post(author_id=popular.sample(), title=self.text(5).capitalize(),
+                               content=self.text(40), created_at=created, updated_at=created)
+            bulk_insert(Post, posts(), self.batch_size)
+
+    def create_comments(self, user_ids, hot_posts):
+        with explicit_timestamps(Comment):
+            def comments():
+                for _ in range(self.counts['comments']):
+                    created = self.moment()
+                    yield Comment(post_id=hot_posts.sample(), author_id=self.rng.choice(user_ids),
+                                  content=self.text(15), created_at=created, updated_at=created)
+            bulk_insert(Comment, comments(), self.batch_size)
+
+    def create_likes(self, user_ids, hot_posts):
+        with explicit_timestamps(Like):
+            return bulk_insert(Like, (
+                Like(user_id=self.rng.choice(user_ids), post_id=hot_posts.sample(), created_at=self.moment())
+                for _ in range(self.counts['likes'])
+            ), self.batch_size, ignore_conflicts=True)
+
+    def create_notifications(self, user_ids, popular, post_ids):
+        post_type = ContentType.objects.get_for_model(Post)
+        with explicit_timestamps(Notification):
+            def notifications():
+                for _ in range(self.counts['notifications']):
+                    created = self.moment()
+                    yield Notification(
+                        recipient_id=popular.sample(), actor_id=self.rng.choice(user_ids),
+                        verb=self.rng.choice(VERBS), target_content_type=post_type,
+                        target_object_id=self.rng.choice(post_ids), created_at=created,
+                        timestamp=created, is_read=self.rng.random() < 0.7,
+                    )
+            bulk_insert(Notification, notifications(), self.batch_size)
+
+    def run(self):
+        self.log(f"Creating {self.counts['users']} users")
+        user_ids = self.create_users()
+        if not user_ids:
+            return self.counts
+        popular = PowerLaw(self.rng.sample(user_ids, len(user_ids)), self.alpha, self.rng)
+
+        self.log(f'Creating follow edges (~{self.follows} per user)')
+        self.counts['follows'] = self.create_follows(user_ids, popular)
+
+        self.log(f"Creating {self.counts['posts']} posts")
+        self.create_posts(popular)
+        post_ids = list(Post.objects.filter(author__username__startswith=f'{self.prefix}_')
+                        .values_list('pk', flat=True))
+        if post_ids:
+            hot_posts = PowerLaw(self.rng.sample(post_ids, len(post_ids)), self.alpha, self.rng)
+            self.log(f"Creating {self.counts['comments']} comments and {self.counts['likes']} likes")
+            self.create_comments(user_ids, hot_posts)
+            self.create_likes(user_ids, hot_posts)
+            self.log(f"Creating {self.counts['notifications']} notifications")
+            self.create_notifications(user_ids, popular, post_ids)
+
+        # bulk_create skips the signals and counters the API maintains
+        self.log('Reconciling counters')
+        call_command('reconcile_post_counters', chunk_size=self.batch_size, stdout=StringIO())
+        call_command('reconcile_follow_counts', chunk_size=self.batch_size, stdout=StringIO())
+        if self.build_feeds:
+            self.log('Building feeds')
+            for user in User.objects.filter(pk__in=user_ids).iterator(chunk_size=self.batch_size):
+                rebuild_feed(user)
+        invalidate_post_list()
+        return self.counts
@@ -0,0 +1,64 @@
+import json
+from io import StringIO
+from django.core.cache import cache
+from django.core.management import call_command
+from rest_framework.test import APITestCase
+from accounts.models import User
+from notifications.models import Notification
+from posts.models import Comment, FeedEntry, Like, Post
+from .benchmark import SCENARIOS, Benchmark
+from .seed import Seeder
+
+
+class SeedDataTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_seed_creates_consistent_data(self):
+        call_command('seed_data', users=30, posts=120, comments=200, likes=300, follows=5,
+                     notifications=50, seed=7, stdout=StringIO())
+
+        self.assertEqual(User.objects.filter(username__startswith='seed_').count(), 30)
+        self.assertEqual(Post.objects.count(), 120)
+        self.assertEqual(Comment.objects.count(), 200)
+        self.assertEqual(Notification.objects.count(), 50)
+        self.assertTrue(FeedEntry.objects.exists())
+        # Counters were reconciled after the bulk inserts
+        for post in Post.objects.all():
+            self.assertEqual(post.likes_count, Like.objects.filter(post=post).count())
+            self.assertEqual(post.comments_count, Comment.objects.filter(post=post).count())
+        user = User.objects.order_by('-followers_count').first()
+        self.assertEqual(user.followers_count, user.followers.count())
+
+    def test_seeding_twice_appends_users(self):
+        Seeder(users=5, posts=0, comments=0, likes=0, notifications=0, build_feeds=False, seed=1).run()
+        Seeder(users=5, posts=0, comments=0, likes=0, notifications=0, build_feeds=False, seed=1).run()
+        self.assertEqual(User.objects.filter(username__startswith='seed_').count(), 10)
+
+
+class BenchmarkTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        Seeder(users=20, posts=60, comments=60, likes=100, follows=5, notifications=40, seed=3).run()
+
+    def test_report_covers_every_scenario(self):
+        user = User.objects.order_by('-following_count').first()
+        likes = set(Like.objects.values_list('user_id', 'post_id'))
+        report = Benchmark(user, requests=4, warmup=1).run()
+
+        self.assertEqual(report['meta']['rows']['posts'], 60)
+        self.assertEqual(set(report['scenarios']), set(SCENARIOS))
+        for scenario, result in report['scenarios'].items():
+            self.assertEqual(sum(result['status'].values()), 4, scenario)
+            self.assertTrue(all(code < '400' for code in result['status']), (scenario, result['status']))
+            self.assertLessEqual(result['latency_ms']['p50'], result['latency_ms']['max'])
+            self.assertIsNotNone(result['queries'])
+        # Like and unlike alternate, so the data set is left unchanged
+        self.assertEqual(set(Like.objects.values_list('user_id', 'post_id')), likes)
+
+    def test_command_writes_json(self):
+        output = StringIO()
+        call_command('run_benchmark', requests=2, warmup=0, scenario=['posts_list'], stdout=output)
+        report = json.loads(output.getvalue())
+        self.assertEqual(list(report['scenarios']), ['posts_list'])
+        self.assertEqual(report['meta']['transport'], 'test-client')
@@ -0,0 +1,29 @@
+import time
+from django.core.management.base import BaseCommand
+from notifications.outbox import DEFAULT_BATCH_SIZE, deliver_all, deliver_pending
+
+
+class Command(BaseCommand):
+    help = 'Delivers queued notifications from the outbox in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds to sleep when the outbox is empty')
+        parser.add_argument('--once', action='store_true',
+                            help='Drain the outbox and exit instead of polling')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if options['once']:
+            delivered = deliver_all(batch_size)
+            self.stdout.write(self.style.SUCCESS(f'Delivered {delivered} notification(s)'))
+            return
+
+        self.stdout.write('Processing notification outbox, press Ctrl+C to stop')
+        try:
+            while True:
+                if not deliver_pending(batch_size):
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,56 @@
+from datetime import timedelta
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from notifications.retention import (
+    DEFAULT_CHUNK_SIZE, NDJSONArchive, delete_in_chunks, expired_notifications,
+    orphaned_notifications,
+)
+
+RETENTION_DAYS = getattr(settings, 'NOTIFICATION_RETENTION_DAYS', 90)
+ARCHIVE_DIR = getattr(settings, 'NOTIFICATION_ARCHIVE_DIR', Path(settings.BASE_DIR) / 'notification_archive')
+
+
+class Command(BaseCommand):
+    help = ('Archives and deletes read notifications older than the retention period, '
+            'and sweeps notifications whose target was deleted')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=RETENTION_DAYS,
+                            help='Keep read notifications newer than this many days')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help='Primary key window deleted per transaction')
+        parser.add_argument('--pause', type=float, default=0,
+                            help='Seconds to sleep between chunks')
+        parser.add_argument('--archive-dir', default=str(ARCHIVE_DIR),
+                            help='Directory receiving the gzip NDJSON archive')
+        parser.add_argument('--no-archive', action='store_true',
+                            help='Delete without archiving')
+        parser.add_argument('--skip-orphans', action='store_true',
+                            help='Do not sweep notifications with a deleted target')
+
+    def handle(self, *args, **options):
+        archive = None
+        if not options['no_archive']:
+            stamp = timezone.now().strftime('%Y%m%dT%H%M%S')
+            archive = NDJSONArchive(Path(options['archive_dir']) / f'notifications-{stamp}.ndjson.gz')
+
+        chunking = {'chunk_size': options['chunk_size'], 'pause': options['pause']}
+        try:
+            cutoff = timezone.now() - timedelta(days=options['days'])
+            expired = delete_in_chunks(expired_notifications(cutoff), archive=archive, **chunking)
+            self.stdout.write(f'Pruned {expired} read notification(s) older than {options["days"]} days')
+
+            if not options['skip_orphans']:
+                for content_type, orphans in orphaned_notifications():
+                    swept = delete_in_chunks(orphans, archive=archive, **chunking)
+                    if swept:
+                        self.stdout.write(f'Swept {swept} notification(s) with a deleted {content_type.model}')
+        finally:
+            if archive is not None:
+                archive.close()
+
+        if archive is not None and archive.file is not None:
+            self.stdout.write(f'Archived to {archive.path}')
+        self.stdout.write(self.style.SUCCESS('Notification retention complete'))
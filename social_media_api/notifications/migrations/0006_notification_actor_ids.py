@@ -0,0 +1,33 @@
+# Generated by Django 5.1.15 on 2026-10-18 18:27
+
+from django.db import migrations, models
+
+
+def seed_actor_ids(apps, schema_editor):
+    # Only unread notifications still aggregate; their earlier actors are
+    # unknown, so start from the latest one
+    Notification = apps.get_model('notifications', 'Notification')
+    batch = []
+    for notification in Notification.objects.filter(is_read=False).only('pk', 'actor_id').iterator():
+        notification.actor_ids = [notification.actor_id]
+        batch.append(notification)
+        if len(batch) == 500:
+            Notification.objects.bulk_update(batch, ['actor_ids'])
+            batch = []
+    Notification.objects.bulk_update(batch, ['actor_ids'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0005_notification_timestamp_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='actor_ids',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.RunPython(seed_actor_ids, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.15 on 2026-10-18 19:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0006_notification_actor_ids'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='notification',
+            name='actor_ids',
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='first_action_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='notificationoutbox',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
@@ -19,11 +20,43 @@ class Notification(models.Model):
     timestamp = models.DateTimeField(auto_now=True)  # Updated timestamp for any changes
     is_read = models.BooleanField(default=False)
 
+    # Aggregation: repeated activity on the same target is folded into one
+    # unread notification ("alice and 41 others liked your post")
+    actor_count = models.PositiveIntegerField(default=1)
+    sample_actors = models.JSONField(default=list, blank=True)  # usernames, most recent first
+    # When the first folded action happened; actor_count is recounted from
+    # the actions recorded since then (see notifications.outbox)
+    first_action_at = models.DateTimeField(null=True, blank=True)
+
     class Meta:
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['recipient', '-created_at']),
+            models.Index(fields=['recipient', 'target_content_type', 'target_object_id', 'verb'],
+                         name='notif_aggregation_key_idx'),
+            # Covers unread counts and mark-all-read without scanning read rows
+            models.Index(fields=['recipient'], condition=models.Q(is_read=False),
+                         name='notif_unread_idx'),
+            # Lets the streaming relay find changed rows
+            models.Index(fields=['timestamp'], name='notif_timestamp_idx'),
         ]
 
     def __str__(self):
         return f'{self.actor} {self.verb} {self.target}'
+
+class NotificationOutbox(models.Model):
+    # Queued notification written in the same transaction as the like or
+    # comment that caused it; notifications.outbox delivers it in batches
+    recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', db_index=False)
+    actor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', db_index=False)
+    verb = models.CharField(max_length=255)
+    target_content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, related_name='+', db_index=False)
+    target_object_id = models.PositiveIntegerField()
+    # When the action happened, set by the write that queued it
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f'Pending: {self.actor_id} {self.verb} {self.target_object_id}'
@@ -0,0 +1,209 @@
+from collections import Counter, defaultdict
+from datetime import timedelta
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.db import connections, router, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+from .models import Notification, NotificationOutbox
+from .pubsub import publish_changes
+from .unread import adjust_unread_count
+
+User = get_user_model()
+
+DEFAULT_BATCH_SIZE = 500
+# Activity on the same (recipient, verb, target) within this window is folded
+# into the existing unread notification instead of adding a row
+AGGREGATION_WINDOW = getattr(settings, 'NOTIFICATION_AGGREGATION_WINDOW', timedelta(hours=24))
+MAX_SAMPLE_ACTORS = getattr(settings, 'NOTIFICATION_SAMPLE_ACTORS', 3)
+# Where each verb's actions are recorded: (model, actor field, target field).
+# An aggregated notification's actor_count is the number of distinct actors
+# in these rows since its first action, so an actor who acts again (like,
+# unlike, like) is not counted twice. Other verbs count folded actions
+ACTION_SOURCES = {
+    'liked': ('posts.Like', 'user', 'post'),
+    'commented on': ('posts.Comment', 'author', 'post'),
+}
+
+
+def enqueue_notification(recipient_id, actor_id, verb, target, created_at=None):
+    """
+    Queue a notification for background delivery. Call this inside the
+    transaction of the write that caused it, so the queued row commits (or
+    rolls back) together with that write. `created_at` is when the action
+    happened, no later than the row the action wrote.
+    """
+    if recipient_id == actor_id:
+        return None
+    return NotificationOutbox.objects.create(
+        recipient_id=recipient_id,
+        actor_id=actor_id,
+        verb=verb,
+        target_content_type=ContentType.objects.get_for_model(target),
+        target_object_id=target.pk,
+        created_at=created_at or timezone.now(),
+    )
+
+
+def enqueue_notifications(actor_id, verb, target_model, recipients, created_at=None):
+    """
+    enqueue_notification() for many targets of one model in a single insert.
+    `recipients` maps each target pk to its recipient's id.
+    """
+    content_type = ContentType.objects.get_for_model(target_model)
+    created_at = created_at or timezone.now()
+    return NotificationOutbox.objects.bulk_create([
+        NotificationOutbox(
+            recipient_id=recipient_id,
+            actor_id=actor_id,
+            verb=verb,
+            target_content_type=content_type,
+            target_object_id=target_pk,
+            created_at=created_at,
+        )
+        for target_pk, recipient_id in recipients.items()
+        if recipient_id != actor_id
+    ])
+
+
+def aggregation_key(obj):
+    return (obj.recipient_id, obj.verb, obj.target_content_type_id, obj.target_object_id)
+
+
+def _add_actor(notification, actor_id, username):
+    if username in notification.sample_actors:
+        # Same actor again: only move them to the front
+        notification.sample_actors.remove(username)
+    else:
+        notification.actor_count += 1
+    notification.sample_actors = [username] + notification.sample_actors[:MAX_SAMPLE_ACTORS - 1]
+    notification.actor_id = actor_id
+
+
+def _count_actors(notifications, using):
+    """
+    Count the distinct actors behind `notifications` ({key: notification})
+    from ACTION_SOURCES, with one query per verb. Returns {key: count} for
+    the notifications that have a source.
+    """
+    by_source = defaultdict(dict)
+    for key, notification in notifications.items():
+        if notification.verb in ACTION_SOURCES and notification.first_action_at is not None:
+            by_source[notification.verb][key] = notification
+
+    counts = {}
+    for verb, group in by_source.items():
+        label, actor_field, target_field = ACTION_SOURCES[verb]
+        model = apps.get_model(label)
+        target_type = ContentType.objects.db_manager(using).get_for_model(
+            model._meta.get_field(target_field).related_model
+        )
+        group = {key: notification for key, notification in group.items()
+                 if notification.target_content_type_id == target_type.id}
+        if not group:
+            continue
+        # The recipient's own actions never notify them
+        condition = Q()
+        for notification in group.values():
+            condition |= (Q(**{target_field: notification.target_object_id,
+                               'created_at__gte': notification.first_action_at})
+                          & ~Q(**{actor_field: notification.recipient_id}))
+        rows = (model._base_manager.using(using).filter(condition).order_by()
+                .values_list(target_field).annotate(actors=Count(actor_field, distinct=True)))
+        per_target = dict(rows)
+        for key, notification in group.items():
+            counts[key] = per_target.get(notification.target_object_id, 0)
+    return counts
+
+
+def aggregate(items, using):
+    """
+    Fold outbox items into notifications. Items whose key matches an unread
+    notification created within AGGREGATION_WINDOW update it in place; the
+    rest become new notifications. Returns (new, updated) notifications.
+    """
+    now = timezone.now()
+    usernames = dict(User.objects.using(using).filter(
+        pk__in={item.actor_id for item in items}
+    ).values_list('pk', 'username'))
+
+    candidates = Notification.objects.using(using).filter(
+        recipient_id__in={item.recipient_id for item in items},
+        target_object_id__in={item.target_object_id for item in items},
+        is_read=False,
+        created_at__gte=now - AGGREGATION_WINDOW,
+    ).order_by('created_at')
+    if connections[using].features.has_select_for_update:
+        # Keeps concurrent workers from folding into the same row at once
+        candidates = candidates.select_for_update()
+    by_key = {aggregation_key(notification): notification for notification in candidates}
+
+    new, updated, folded = {}, {}, {}
+    for item in items:
+        key = aggregation_key(item)
+        username = usernames.get(item.actor_id, '')
+        notification = by_key.get(key)
+        if notification is None:
+            notification = Notification(
+                recipient_id=item.recipient_id,
+                actor_id=item.actor_id,
+                verb=item.verb,
+                target_content_type_id=item.target_content_type_id,
+                target_object_id=item.target_object_id,
+                actor_count=1,
+                sample_actors=[username],
+                first_action_at=item.created_at,
+            )
+            by_key[key] = new[key] = notification
+            continue
+        _add_actor(notification, item.actor_id, username)
+        folded[key] = notification
+        if key not in new:
+            notification.timestamp = now
+            updated[key] = notification
+
+    for key, count in _count_actors(folded, using).items():
+        folded[key].actor_count = max(count, 1)
+    return list(new.values()), list(updated.values())
+
+
+def _after_delivery(new, updated):
+    per_recipient = Counter(notification.recipient_id for notification in new)
+    for recipient_id, count in per_recipient.items():
+        adjust_unread_count(recipient_id, count)
+    publish_changes({notification.recipient_id for notification in new + updated})
+
+
+def deliver_pending(batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Move one batch from the outbox into the notifications table.
+    Returns the number of delivered items; 0 means the outbox is empty.
+    """
+    db = router.db_for_write(NotificationOutbox)
+    with transaction.atomic(using=db):
+        pending = NotificationOutbox.objects.using(db).order_by('id')
+        if connections[db].features.has_select_for_update_skip_locked:
+            # Lets several workers drain the outbox without blocking each other
+            pending = pending.select_for_update(skip_locked=True)
+        items = list(pending[:batch_size])
+        if not items:
+            return 0
+        new, updated = aggregate(items, db)
+        Notification.objects.using(db).bulk_create(new)
+        transaction.on_commit(lambda: _after_delivery(new, updated), using=db)
+        Notification.objects.using(db).bulk_update(
+            updated, ['actor', 'actor_count', 'sample_actors', 'timestamp']
+        )
+        NotificationOutbox.objects.using(db).filter(id__in=[item.id for item in items]).delete()
+    return len(items)
+
+
+def deliver_all(batch_size=DEFAULT_BATCH_SIZE):
+    delivered = 0
+    while True:
+        count = deliver_pending(batch_size)
+        if not count:
+            return delivered
+        delivered += count
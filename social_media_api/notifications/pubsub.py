@@ -0,0 +1,134 @@
+import asyncio
+import threading
+from collections import defaultdict
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+# Pub/sub used to wake streaming connections when a recipient's
+# notifications change. The default broker only reaches subscribers in the
+# current process, so each process runs one relay that polls for changes
+# while it has subscribers. A shared broker (e.g. Redis) can replace it
+# through NOTIFICATIONS_BROKER; it must provide publish(), subscribe() and
+# a `needs_relay` attribute.
+
+BROKER_CLASS = getattr(settings, 'NOTIFICATIONS_BROKER', 'notifications.pubsub.InProcessBroker')
+RELAY_INTERVAL = getattr(settings, 'NOTIFICATIONS_RELAY_INTERVAL', 1.0)
+# Rows can commit slightly after their timestamp; look back this far
+CHANGE_LOOKBACK = timedelta(seconds=2)
+
+
+class InProcessBroker:
+    needs_relay = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def publish(self, user_id, message=None):
+        """Wake every subscriber of `user_id`. Safe to call from any thread."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(queue.put_nowait, message)
+
+    def subscribed_users(self):
+        with self._lock:
+            return set(self._subscribers)
+
+    def subscribe(self, user_id):
+        return Subscription(self, user_id)
+
+    def _add(self, user_id, entry):
+        with self._lock:
+            self._subscribers[user_id].add(entry)
+
+    def _discard(self, user_id, entry):
+        with self._lock:
+            self._subscribers[user_id].discard(entry)
+            if not self._subscribers[user_id]:
+                del self._subscribers[user_id]
+
+
+class Subscription:
+    """
+    Async context manager yielding a queue that receives the user's messages.
+    A plain class rather than an async generator, so a stream finalized at
+    loop shutdown can still unsubscribe.
+    """
+
+    def __init__(self, broker, user_id):
+        self.broker = broker
+        self.user_id = user_id
+        self.entry = None
+
+    async def __aenter__(self):
+        self.entry = (asyncio.get_running_loop(), asyncio.Queue())
+        self.broker._add(self.user_id, self.entry)
+        return self.entry[1]
+
+    async def __aexit__(self, *exc_info):
+        self.broker._discard(self.user_id, self.entry)
+
+
+class ChangeRelay:
+    """
+    Polls for changed notifications once per interval for the whole process,
+    and only while someone in this process is subscribed, then publishes to
+    the affected local subscribers.
+    """
+
+    def __init__(self, broker, interval=RELAY_INTERVAL):
+        self.broker = broker
+        self.interval = interval
+        self.task = None
+
+    def ensure_running(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def run(self):
+        since = timezone.now()
+        while self.broker.subscribed_users():
+            await asyncio.sleep(self.interval)
+            checked_at = timezone.now()
+            recipients = await sync_to_async(changed_recipients)(since - CHANGE_LOOKBACK)
+            since = checked_at
+            for user_id in recipients & self.broker.subscribed_users():
+                self.broker.publish(user_id)
+
+
+def changed_recipients(since):
+    from .models import Notification
+    return set(Notification.objects.filter(timestamp__gt=since)
+               .values_list('recipient_id', flat=True).distinct())
+
+
+_broker = None
+_relay = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        _broker = import_string(BROKER_CLASS)()
+    return _broker
+
+
+def ensure_relay():
+    """Start this process' relay if the configured broker needs one."""
+    global _relay
+    broker = get_broker()
+    if not getattr(broker, 'needs_relay', False):
+        return
+    if _relay is None:
+        _relay = ChangeRelay(broker)
+    _relay.ensure_running()
+
+
+def publish_changes(user_ids):
+    broker = get_broker()
+    for user_id in user_ids:
+        broker.publish(user_id)
@@ -0,0 +1,98 @@
+import gzip
+import json
+import time
+from django.contrib.contenttypes.models import ContentType
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Exists, Max, Min, OuterRef
+from .models import Notification
+from .unread import forget_unread_counts
+
+DEFAULT_CHUNK_SIZE = 1000
+
+ARCHIVE_FIELDS = [
+    'id', 'recipient_id', 'actor_id', 'verb', 'target_content_type__app_label',
+    'target_content_type__model', 'target_object_id', 'actor_count', 'sample_actors',
+    'created_at', 'timestamp', 'is_read',
+]
+
+
+class NDJSONArchive:
+    """Appends notification rows to a gzip-compressed newline-delimited JSON file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def write(self, rows):
+        if self.file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.file = gzip.open(self.path, 'at', encoding='utf-8')
+        for row in rows:
+            self.file.write(json.dumps(row, cls=DjangoJSONEncoder) + '\n')
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+def pk_ranges(queryset, chunk_size):
+    """Yield half-open [start, end) primary key windows covering `queryset`."""
+    bounds = queryset.aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['low'] is None:
+        return
+    for start in range(bounds['low'], bounds['high'] + 1, chunk_size):
+        yield start, start + chunk_size
+
+
+def delete_in_chunks(queryset, chunk_size=DEFAULT_CHUNK_SIZE, archive=None, pause=0):
+    """
+    Delete `queryset` one primary-key window at a time, each window in its own
+    short transaction so no lock is held for long. Returns the deleted count.
+    """
+    deleted = 0
+    for start, end in pk_ranges(queryset, chunk_size):
+        with transaction.atomic():
+            chunk = queryset.filter(pk__gte=start, pk__lt=end)
+            if archive is not None:
+                rows = list(chunk.values(*ARCHIVE_FIELDS))
+                ids = [row['id'] for row in rows]
+                archive.write(rows)
+            else:
+                ids = list(chunk.values_list('pk', flat=True))
+            if not ids:
+                continue
+            unread_recipients = set(Notification.objects.filter(
+                pk__in=ids, is_read=False
+            ).values_list('recipient_id', flat=True))
+            deleted += Notification.objects.filter(pk__in=ids).delete()[0]
+        if unread_recipients:
+            forget_unread_counts(unread_recipients)
+        if pause:
+            time.sleep(pause)
+    return deleted
+
+
+def expired_notifications(cutoff):
+    """Read notifications created before `cutoff`."""
+    return Notification.objects.filter(is_read=True, created_at__lt=cutoff)
+
+
+def orphaned_notifications():
+    """
+    Yield (content type, queryset) pairs of notifications whose target no
+    longer exists; GenericForeignKey targets do not cascade on delete.
+    """
+    content_type_ids = (Notification.objects.order_by()
+                        .values_list('target_content_type', flat=True).distinct())
+    for content_type in ContentType.objects.filter(pk__in=list(content_type_ids)):
+        notifications = Notification.objects.filter(target_content_type=content_type)
+        model = content_type.model_class()
+        if model is None:
+            # The target model itself is gone
+            yield content_type, notifications
+            continue
+        yield content_type, notifications.exclude(Exists(
+            model._base_manager.filter(pk=OuterRef('target_object_id'))
+        ))
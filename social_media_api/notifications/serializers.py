@@ -1,12 +1,52 @@
+from django.utils.text import Truncator
 from rest_framework import serializers
 from .models import Notification
 
+EXPAND_QUERY_PARAM = 'expand'
+TARGET_PREVIEW_LENGTH = 100
+
+
+def expands_target(request):
+    if request is None:
+        return False
+    return 'target' in request.query_params.get(EXPAND_QUERY_PARAM, '').split(',')
+
+
 class NotificationSerializer(serializers.ModelSerializer):
     actor = serializers.ReadOnlyField(source='actor.username')
     target_type = serializers.ReadOnlyField(source='target_content_type.model')
+    actors = serializers.SerializerMethodField()
+    target = serializers.SerializerMethodField()
     
     class Meta:
         model = Notification
-        fields = ['id', 'actor', 'verb', 'target_type', 'target_object_id', 
-                 'created_at', 'is_read']
-        read_only_fields = ['created_at']
\ No newline at end of file
+        fields = ['id', 'actor', 'actors', 'actor_count', 'verb', 'target_type',
+                 'target_object_id', 'target', 'created_at', 'timestamp', 'is_read']
+        read_only_fields = ['created_at', 'timestamp', 'actor_count']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # The target summary is opt-in with ?expand=target; the view
+        # prefetches targets for the whole page in that case
+        if not expands_target(self.context.get('request')):
+            self.fields.pop('target')
+
+    def get_actors(self, obj):
+        # Sample of the most recent actors; rows created before aggregation
+        # only know their single actor
+        return obj.sample_actors or [obj.actor.username]
+
+    def get_target(self, obj):
+        target = obj.target
+        if target is None:
+            return None
+        summary = {'type': target._meta.model_name, 'id': target.pk}
+        if hasattr(target, 'title'):
+            summary['title'] = target.title
+        if hasattr(target, 'content'):
+            summary['content'] = Truncator(target.content).chars(TARGET_PREVIEW_LENGTH)
+        if hasattr(target, 'author_id'):
+            summary['author'] = target.author.username
+        if hasattr(target, 'post_id'):
+            summary['post'] = target.post_id
+        return summary
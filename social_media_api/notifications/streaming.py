@@ -0,0 +1,137 @@
+import asyncio
+import datetime
+import json
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from social_media_api.query_budget import query_budget
+from .models import Notification
+from .pubsub import CHANGE_LOOKBACK, ensure_relay, get_broker
+from .serializers import NotificationSerializer
+
+# Async push endpoints for notifications; serve them through asgi.py. An
+# idle connection waits on the broker and touches neither the CPU nor the
+# database until its recipient has a change.
+
+HEARTBEAT_INTERVAL = getattr(settings, 'NOTIFICATIONS_STREAM_HEARTBEAT', 15)
+MAX_POLL_TIMEOUT = getattr(settings, 'NOTIFICATIONS_MAX_POLL_TIMEOUT', 30)
+MAX_EVENTS_PER_FETCH = 100
+
+
+def authenticate(request):
+    """Authenticate with the configured DRF authentication classes."""
+    drf_request = Request(request, authenticators=[
+        auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    ])
+    try:
+        user = drf_request.user
+    except exceptions.APIException:
+        return None
+    return user if user.is_authenticated else None
+
+
+class ChangeTracker:
+    """Returns a recipient's notifications created or changed since the last fetch."""
+
+    def __init__(self, user_id, since):
+        self.user_id = user_id
+        self.since = since
+        self.sent = {}
+
+    def fetch(self):
+        notifications = list(Notification.objects.filter(
+            recipient_id=self.user_id,
+            timestamp__gt=self.since - CHANGE_LOOKBACK,
+        ).select_related('actor', 'target_content_type').order_by('timestamp', 'id')[:MAX_EVENTS_PER_FETCH])
+
+        fresh = [n for n in notifications if self.sent.get(n.id) != n.timestamp]
+        for notification in fresh:
+            self.sent[notification.id] = notification.timestamp
+            self.since = max(self.since, notification.timestamp)
+        horizon = self.since - CHANGE_LOOKBACK
+        self.sent = {pk: ts for pk, ts in self.sent.items() if ts > horizon}
+        return [(n.timestamp, NotificationSerializer(n).data) for n in fresh]
+
+
+def parse_since(value):
+    since = parse_datetime(value) if value else None
+    if since is None:
+        return None
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since, datetime.timezone.utc)
+    return since
+
+
+def format_event(timestamp, data):
+    return f'id: {timestamp.isoformat()}\nevent: notification\ndata: {json.dumps(data)}\n\n'
+
+
+async def event_stream(user_id, since):
+    broker = get_broker()
+    tracker = ChangeTracker(user_id, since or timezone.now())
+    async with broker.subscribe(user_id) as queue:
+        ensure_relay()
+        yield 'retry: 3000\n\n'
+        # Only replay history when resuming from Last-Event-ID
+        changed = since is not None
+        while True:
+            if changed:
+                for timestamp, data in await sync_to_async(tracker.fetch)():
+                    yield format_event(timestamp, data)
+            try:
+                await asyncio.wait_for(queue.get(), timeout=HEARTBEAT_INTERVAL)
+                changed = True
+            except asyncio.TimeoutError:
+                yield ': keep-alive\n\n'
+                changed = False
+
+
+async def notification_stream(request):
+    """Server-Sent Events stream of the user's new and updated notifications."""
+    user = await sync_to_async(authenticate)(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+    since = parse_since(request.headers.get('Last-Event-ID'))
+    response = StreamingHttpResponse(event_stream(user.id, since), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Disable proxy buffering (nginx)
+    return response
+
+
+@query_budget(1)
+async def notification_poll(request):
+    """
+    Long-poll fallback: returns as soon as the user has notifications newer
+    than `?since=`, or an empty list after `?timeout=` seconds.
+    """
+    user = await sync_to_async(authenticate)(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+    try:
+        timeout = max(0, min(float(request.GET.get('timeout', MAX_POLL_TIMEOUT)), MAX_POLL_TIMEOUT))
+    except ValueError:
+        timeout = MAX_POLL_TIMEOUT
+    tracker = ChangeTracker(user.id, parse_since(request.GET.get('since')) or timezone.now())
+
+    # Subscribe before the first fetch so a change in between is not missed
+    async with get_broker().subscribe(user.id) as queue:
+        ensure_relay()
+        changes = await sync_to_async(tracker.fetch)()
+        if not changes and timeout > 0:
+            try:
+                await asyncio.wait_for(queue.get(), timeout=timeout)
+                changes = await sync_to_async(tracker.fetch)()
+            except asyncio.TimeoutError:
+                pass
+
+    return JsonResponse({
+        'results': [data for _, data in changes],
+        'since': tracker.since.isoformat(),
+    })
@@ -1,3 +1,334 @@
+import asyncio
+import gzip
+import json
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from unittest.mock import patch
+from asgiref.sync import sync_to_async
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
 from django.test import TestCase
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+from django.contrib.auth import get_user_model
+from posts.models import Post, Comment
+from .models import Notification, NotificationOutbox
+from .outbox import deliver_pending, enqueue_notification
+from .pubsub import get_broker
+from .streaming import event_stream
 
-# Create your tests here.
+User = get_user_model()
+
+class OutboxTests(APITestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author', password='testpass123')
+        self.reader = User.objects.create_user(username='reader', password='testpass123')
+        self.post = Post.objects.create(author=self.author, title='Post', content='Content')
+        self.client.force_authenticate(user=self.reader)
+
+    def test_like_queues_notification_instead_of_creating_it(self):
+        self.client.post(reverse('post-like', kwargs={'pk': self.post.pk}))
+        self.assertEqual(NotificationOutbox.objects.count(), 1)
+        self.assertFalse(Notification.objects.exists())
+
+        self.assertEqual(deliver_pending(), 1)
+        notification = Notification.objects.get()
+        self.assertEqual((notification.recipient, notification.actor, notification.verb),
+                         (self.author, self.reader, 'liked'))
+        self.assertEqual(notification.target, self.post)
+        self.assertFalse(NotificationOutbox.objects.exists())
+
+    def test_own_actions_are_not_queued(self):
+        self.client.force_authenticate(user=self.author)
+        self.client.post(reverse('comment-list'), {'post': self.post.pk, 'content': 'Self'})
+        self.assertFalse(NotificationOutbox.objects.exists())
+
+    def test_command_drains_outbox_in_batches(self):
+        self.client.post(reverse('post-like', kwargs={'pk': self.post.pk}))
+        self.client.post(reverse('comment-list'), {'post': self.post.pk, 'content': 'Hi'})
+        call_command('process_notification_outbox', '--once', '--batch-size', '1', stdout=StringIO())
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertFalse(NotificationOutbox.objects.exists())
+
+class AggregationTests(APITestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author', password='testpass123')
+        self.post = Post.objects.create(author=self.author, title='Popular', content='Content')
+        self.likers = [
+            User.objects.create_user(username=f'liker{i}', password='testpass123')
+            for i in range(5)
+        ]
+
+    def like_as(self, user):
+        self.client.force_authenticate(user=user)
+        self.client.post(reverse('post-like', kwargs={'pk': self.post.pk}))
+
+    def test_likes_on_same_post_are_aggregated(self):
+        for liker in self.likers[:3]:
+            self.like_as(liker)
+        deliver_pending()
+        for liker in self.likers[3:]:
+            self.like_as(liker)
+        deliver_pending()
+
+        notification = Notification.objects.get()
+        self.assertEqual(notification.actor_count, 5)
+        self.assertEqual(notification.actor, self.likers[4])
+        self.assertEqual(notification.sample_actors, ['liker4', 'liker3', 'liker2'])
+
+        self.client.force_authenticate(user=self.author)
+        response = self.client.get(reverse('notification-list'))
+        item = response.data['results'][0]
+        self.assertEqual((item['actor_count'], item['actors'][0]), (5, 'liker4'))
+
+    def test_returning_actors_are_not_counted_twice(self):
+        for liker in self.likers[:4]:
+            self.like_as(liker)
+        deliver_pending()
+        # likers[0] has left the sample; unliking and liking again must not count them again
+        self.client.force_authenticate(user=self.likers[0])
+        self.client.delete(reverse('post-like', kwargs={'pk': self.post.pk}))
+        self.like_as(self.likers[0])
+        deliver_pending()
+
+        notification = Notification.objects.get()
+        self.assertEqual(notification.actor_count, 4)
+        self.assertEqual(notification.sample_actors, ['liker0', 'liker3', 'liker2'])
+
+    def test_repeat_commenters_are_counted_once(self):
+        for commenter in self.likers[:4] + self.likers[:1]:
+            self.client.force_authenticate(user=commenter)
+            self.client.post(reverse('comment-list'), {'post': self.post.pk, 'content': 'Hi'})
+            deliver_pending()
+
+        notification = Notification.objects.get()
+        self.assertEqual(notification.actor_count, 4)
+        self.assertEqual(len(notification.sample_actors), 3)
+
+    def test_read_notifications_are_not_reopened(self):
+        self.like_as(self.likers[0])
+        deliver_pending()
+        self.client.force_authenticate(user=self.author)
+        first = Notification.objects.get()
+        self.client.post(reverse('mark-read', kwargs={'pk': first.pk}))
+
+        self.like_as(self.likers[1])
+        deliver_pending()
+        first.refresh_from_db()
+        self.assertTrue(first.is_read)
+        self.assertEqual(first.actor_count, 1)
+        self.assertEqual(Notification.objects.filter(is_read=False).get().actor, self.likers[1])
+
+    def test_different_verbs_are_kept_apart(self):
+        self.like_as(self.likers[0])
+        self.client.post(reverse('comment-list'), {'post': self.post.pk, 'content': 'Hi'})
+        deliver_pending()
+        self.assertEqual(sorted(Notification.objects.values_list('verb', flat=True)),
+                         ['commented on', 'liked'])
+
+class UnreadCountTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author', password='testpass123')
+        self.reader = User.objects.create_user(username='reader', password='testpass123')
+        self.posts = [
+            Post.objects.create(author=self.author, title=f'Post {i}', content='Content')
+            for i in range(3)
+        ]
+
+    def unread_count(self):
+        self.client.force_authenticate(user=self.author)
+        return self.client.get(reverse('unread-count')).data['unread_count']
+
+    def deliver_likes(self, posts):
+        self.client.force_authenticate(user=self.reader)
+        for post in posts:
+            self.client.post(reverse('post-like', kwargs={'pk': post.pk}))
+        with self.captureOnCommitCallbacks(execute=True):
+            deliver_pending()
+
+    def test_counter_follows_delivery_and_read_state(self):
+        self.assertEqual(self.unread_count(), 0)
+        self.deliver_likes(self.posts)
+        self.assertEqual(self.unread_count(), 3)
+
+        notification = Notification.objects.filter(recipient=self.author).first()
+        self.client.post(reverse('mark-read', kwargs={'pk': notification.pk}))
+        self.assertEqual(self.unread_count(), 2)
+
+        self.client.post(reverse('mark-all-read'))
+        self.assertEqual(self.unread_count(), 0)
+        self.assertFalse(Notification.objects.filter(is_read=False).exists())
+
+    def test_worker_updates_reach_the_web_process_cache(self):
+        self.assertEqual(self.unread_count(), 0)
+        # The outbox worker runs in its own process, with its own connection
+        # to the shared cache
+        with patch('notifications.unread.cache', caches.create_connection('default')):
+            self.deliver_likes(self.posts[:2])
+        self.assertEqual(self.unread_count(), 2)
+
+    def test_counter_is_served_from_cache(self):
+        self.deliver_likes(self.posts[:1])
+        self.unread_count()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(reverse('unread-count')).data['unread_count'], 1)
+
+    def test_missing_counter_falls_back_to_database(self):
+        self.deliver_likes(self.posts[:2])
+        cache.clear()
+        self.assertEqual(self.unread_count(), 2)
+
+class RetentionTests(APITestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author', password='testpass123')
+        self.reader = User.objects.create_user(username='reader', password='testpass123')
+        self.post = Post.objects.create(author=self.author, title='Post', content='Content')
+
+    def notify(self, target, is_read=False, age_days=0):
+        notification = Notification.objects.create(
+            recipient=self.author, actor=self.reader, verb='liked', target=target, is_read=is_read
+        )
+        Notification.objects.filter(pk=notification.pk).update(
+            created_at=timezone.now() - timedelta(days=age_days)
+        )
+        return notification
+
+    def test_prunes_old_read_notifications_into_archive(self):
+        old_read = self.notify(self.post, is_read=True, age_days=120)
+        old_unread = self.notify(self.post, age_days=120)
+        recent_read = self.notify(self.post, is_read=True, age_days=1)
+
+        with tempfile.TemporaryDirectory() as archive_dir:
+            call_command('prune_notifications', '--days', '90', '--chunk-size', '1',
+                         '--archive-dir', archive_dir, stdout=StringIO())
+            [archive] = Path(archive_dir).glob('*.ndjson.gz')
+            with gzip.open(archive, 'rt') as f:
+                archived = [json.loads(line) for line in f]
+
+        self.assertEqual([row['id'] for row in archived], [old_read.id])
+        self.assertEqual(archived[0]['target_content_type__model'], 'post')
+        self.assertEqual(set(Notification.objects.values_list('id', flat=True)),
+                         {old_unread.id, recent_read.id})
+
+    def test_sweeps_notifications_for_deleted_targets(self):
+        kept = self.notify(self.post)
+        doomed_post = Post.objects.create(author=self.author, title='Gone', content='Soon')
+        self.notify(doomed_post)
+        doomed_post.delete()
+
+        call_command('prune_notifications', '--no-archive', stdout=StringIO())
+        self.assertEqual(list(Notification.objects.values_list('id', flat=True)), [kept.id])
+
+class StreamingTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author', password='testpass123')
+        self.reader = User.objects.create_user(username='reader', password='testpass123')
+        self.post = Post.objects.create(author=self.author, title='Post', content='Content')
+        self.headers = {'Authorization': f'Token {Token.objects.create(user=self.author).key}'}
+
+    def queue_like(self):
+        enqueue_notification(self.author.id, self.reader.id, 'liked', self.post)
+
+    def deliver(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            deliver_pending()
+
+    async def test_poll_requires_authentication(self):
+        response = await self.async_client.get(reverse('notification-poll'))
+        self.assertEqual(response.status_code, 401)
+
+    async def test_poll_returns_existing_changes_immediately(self):
+        since = timezone.now() - timedelta(minutes=1)
+        await sync_to_async(self.queue_like)()
+        await sync_to_async(self.deliver)()
+        response = await self.async_client.get(
+            reverse('notification-poll'), {'since': since.isoformat(), 'timeout': 0}, headers=self.headers
+        )
+        self.assertEqual([item['verb'] for item in response.json()['results']], ['liked'])
+
+    async def test_poll_wakes_up_on_delivery(self):
+        poll = asyncio.ensure_future(self.async_client.get(
+            reverse('notification-poll'), {'timeout': 5}, headers=self.headers
+        ))
+        await asyncio.sleep(0.2)
+        await sync_to_async(self.queue_like)()
+        await sync_to_async(self.deliver)()
+        response = await asyncio.wait_for(poll, timeout=5)
+        self.assertEqual(len(response.json()['results']), 1)
+
+    async def test_stream_pushes_delivered_notifications(self):
+        response = await self.async_client.get(reverse('notification-stream'), headers=self.headers)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = response.streaming_content
+        self.assertEqual(await anext(events), b'retry: 3000\n\n')
+
+        next_event = asyncio.ensure_future(anext(events))
+        await asyncio.sleep(0.1)
+        await sync_to_async(self.queue_like)()
+        await sync_to_async(self.deliver)()
+        event = (await asyncio.wait_for(next_event, timeout=5)).decode()
+
+        self.assertIn('event: notification', event)
+        data = json.loads(event.split('data: ', 1)[1])
+        self.assertEqual((data['verb'], data['actors']), ('liked', ['reader']))
+
+    async def test_closing_the_stream_unsubscribes(self):
+        stream = event_stream(self.author.id, None)
+        await anext(stream)
+        self.assertIn(self.author.id, get_broker().subscribed_users())
+        await stream.aclose()
+        self.assertNotIn(self.author.id, get_broker().subscribed_users())
+
+class TargetExpansionTests(APITestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author', password='testpass123')
+        self.reader = User.objects.create_user(username='reader', password='testpass123')
+        self.posts = [
+            Post.objects.create(author=self.author, title=f'Post {i}', content='Content ' * 30)
+            for i in range(4)
+        ]
+        for post in self.posts:
+            Notification.objects.create(recipient=self.author, actor=self.reader, verb='liked', target=post)
+        comment = Comment.objects.create(post=self.posts[0], author=self.reader, content='Reply')
+        Notification.objects.create(recipient=self.author, actor=self.reader, verb='commented on', target=comment)
+        self.client.force_authenticate(user=self.author)
+
+    def test_target_is_opt_in(self):
+        response = self.client.get(reverse('notification-list'))
+        self.assertNotIn('target', response.data['results'][0])
+
+    def test_expanded_targets_are_summarized(self):
+        response = self.client.get(reverse('notification-list'), {'expand': 'target'})
+        comment_target, post_target = response.data['results'][0]['target'], response.data['results'][1]['target']
+        self.assertEqual((comment_target['type'], comment_target['author'], comment_target['post']),
+                         ('comment', 'reader', self.posts[0].id))
+        self.assertEqual((post_target['type'], post_target['title']), ('post', 'Post 3'))
+        self.assertLessEqual(len(post_target['content']), 100)
+
+    def test_targets_are_loaded_per_content_type(self):
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(reverse('notification-list'), {'expand': 'target', 'page_size': 2})
+        with CaptureQueriesContext(connection) as large:
+            self.client.get(reverse('notification-list'), {'expand': 'target', 'page_size': 5})
+        self.assertEqual(len(small), len(large))
+
+    def test_deleted_target_is_null(self):
+        self.posts[3].delete()
+        response = self.client.get(reverse('notification-list'), {'expand': 'target'})
+        self.assertIsNone(response.data['results'][1]['target'])
+
+    def test_list_answers_conditional_requests(self):
+        response = self.client.get(reverse('notification-list'))
+        not_modified = self.client.get(reverse('notification-list'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+        self.client.post(reverse('mark-all-read'))
+        changed = self.client.get(reverse('notification-list'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.core.cache import cache
+from .models import Notification
+
+# Per-user unread counters live in the cache and are adjusted as
+# notifications are delivered and read. A missing counter is recomputed from
+# the partial (recipient) WHERE is_read = false index.
+UNREAD_COUNT_TIMEOUT = getattr(settings, 'NOTIFICATION_UNREAD_COUNT_TIMEOUT', 300)
+
+
+def _key(user_id):
+    return f'notifications:unread:{user_id}'
+
+
+def get_unread_count(user_id):
+    count = cache.get(_key(user_id))
+    if count is None:
+        count = Notification.objects.filter(recipient_id=user_id, is_read=False).count()
+        cache.set(_key(user_id), count, UNREAD_COUNT_TIMEOUT)
+    return count
+
+
+def adjust_unread_count(user_id, delta):
+    try:
+        count = cache.incr(_key(user_id), delta)
+    except ValueError:
+        # Not cached: the next read recomputes it
+        return
+    if count < 0:
+        cache.delete(_key(user_id))
+
+
+def set_unread_count(user_id, count):
+    cache.set(_key(user_id), count, UNREAD_COUNT_TIMEOUT)
+
+
+def forget_unread_counts(user_ids):
+    cache.delete_many([_key(user_id) for user_id in user_ids])
@@ -1,8 +1,11 @@
 from django.urls import path
-from . import views
+from . import streaming, views
 
 urlpatterns = [
     path('', views.NotificationListView.as_view(), name='notification-list'),
+    path('stream/', streaming.notification_stream, name='notification-stream'),
+    path('poll/', streaming.notification_poll, name='notification-poll'),
+    path('unread-count/', views.UnreadNotificationCountView.as_view(), name='unread-count'),
     path('mark-read/', views.MarkNotificationReadView.as_view(), name='mark-all-read'),
     path('mark-read/<int:pk>/', views.MarkNotificationReadView.as_view(), name='mark-read'),
 ]
\ No newline at end of file
@@ -1,40 +1,71 @@
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from django.utils import timezone
 from .models import Notification
-from .serializers import NotificationSerializer
+from django.apps import apps
+from django.contrib.contenttypes.prefetch import GenericPrefetch
+from social_media_api.conditional import ConditionalGetMixin
+from social_media_api.replicas import ReplicaReadMixin
+from .serializers import NotificationSerializer, expands_target
+from .unread import adjust_unread_count, get_unread_count, set_unread_count
 
-class NotificationListView(generics.ListAPIView):
+# Target models loaded with their author when targets are expanded; other
+# target types are still resolved with one query per content type
+TARGET_MODELS = ['posts.Post', 'posts.Comment']
+
+class NotificationListView(ReplicaReadMixin, ConditionalGetMixin, generics.ListAPIView):
     serializer_class = NotificationSerializer
     permission_classes = [permissions.IsAuthenticated]
+    etag_fields = ('id', 'timestamp', 'is_read', 'actor_count')
+    modified_field = 'timestamp'
+    query_budget = 3
+    replica_actions = ('get',)
 
     def get_queryset(self):
-        return Notification.objects.filter(recipient=self.request.user).order_by('-created_at')
+        queryset = Notification.objects.filter(
+            recipient=self.request.user
+        ).select_related('actor', 'target_content_type').order_by('-created_at')
+        if expands_target(self.request):
+            queryset = queryset.prefetch_related(GenericPrefetch('target', [
+                apps.get_model(label)._base_manager.select_related('author')
+                for label in TARGET_MODELS
+            ]))
+        return queryset
+
+class UnreadNotificationCountView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    query_budget = 1
+
+    def get(self, request):
+        return Response({'unread_count': get_unread_count(request.user.id)})
 
 class MarkNotificationReadView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    query_budget = 1
 
     def post(self, request, pk=None):
         if pk:
             # Mark single notification as read
-            notification = Notification.objects.filter(
+            updated = Notification.objects.filter(
                 recipient=request.user,
                 id=pk,
                 is_read=False
-            ).first()
+            ).update(is_read=True, timestamp=timezone.now())
             
-            if notification:
-                notification.is_read = True
-                notification.save()
+            if updated:
+                adjust_unread_count(request.user.id, -1)
                 return Response({'message': 'Notification marked as read'})
             return Response(
                 {'error': 'Notification not found'},
                 status=status.HTTP_404_NOT_FOUND
             )
         else:
-            # Mark all notifications as read
+            # Mark all notifications as read; only touches unread rows through
+            # the partial unread index
             Notification.objects.filter(
                 recipient=request.user,
                 is_read=False
-            ).update(is_read=True)
+            ).update(is_read=True, timestamp=timezone.now())
+            set_unread_count(request.user.id, 0)
             return Response({'message': 'All notifications marked as read'})
@@ -0,0 +1,116 @@
+import hashlib
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from .models import Like
+
+# Read-through cache for serialized posts, shared by every viewer.
+#
+# Each post has a version token in the cache and its body is stored under
+# that version, so invalidating a post only drops its version key: the next
+# read mints a new token and old bodies expire unused. Pages of the
+# unfiltered list are cached as post ids under a list version that changes
+# when posts are created or deleted. Bodies are stored without `is_liked`,
+# which is merged in per request.
+POST_CACHE_TIMEOUT = getattr(settings, 'POST_CACHE_TIMEOUT', 300)
+# Versions outlive the bodies stored under them
+VERSION_TIMEOUT = POST_CACHE_TIMEOUT * 4
+LIST_VERSION_KEY = 'posts:list:version'
+PERSONAL_FIELDS = ('is_liked',)
+
+
+def _version_key(post_id):
+    return f'posts:version:{post_id}'
+
+
+def _body_key(post_id, version, variant):
+    return f'posts:body:{post_id}:{version}:{variant}'
+
+
+def _new_version():
+    return uuid.uuid4().hex
+
+
+def get_versions(post_ids):
+    keys = {_version_key(post_id): post_id for post_id in post_ids}
+    found = cache.get_many(keys)
+    versions = {keys[key]: version for key, version in found.items()}
+    missing = {key: _new_version() for key, post_id in keys.items() if post_id not in versions}
+    if missing:
+        cache.set_many(missing, VERSION_TIMEOUT)
+        versions.update((keys[key], version) for key, version in missing.items())
+    return versions
+
+
+def get_post_bodies(post_ids, variant, load):
+    """
+    Return {post_id: shared body} for `post_ids`. Bodies missing from the
+    cache are built by `load(missing_ids)`, which returns the same mapping;
+    ids it leaves out (deleted posts) are left out of the result too.
+    """
+    # Versions are read before loading, for the same reason as page_key()
+    versions = get_versions(post_ids)
+    keys = {_body_key(post_id, versions[post_id], variant): post_id for post_id in post_ids}
+    bodies = {keys[key]: body for key, body in cache.get_many(keys).items()}
+    missing = [post_id for post_id in post_ids if post_id not in bodies]
+    if missing:
+        loaded = load(missing)
+        cache.set_many({
+            _body_key(post_id, versions[post_id], variant): body for post_id, body in loaded.items()
+        }, POST_CACHE_TIMEOUT)
+        bodies.update(loaded)
+    return bodies
+
+
+def shared_body(data):
+    return {key: value for key, value in data.items() if key not in PERSONAL_FIELDS}
+
+
+def personalize(bodies, user):
+    """Copy the shared bodies and add the viewer's is_liked with one query."""
+    liked = set()
+    if user.is_authenticated and bodies:
+        liked = set(Like.objects.filter(user=user, post_id__in=[body['id'] for body in bodies])
+                    .values_list('post_id', flat=True))
+    return [dict(body, is_liked=body['id'] in liked) for body in bodies]
+
+
+def page_key(request):
+    """
+    Cache key of the list page for this URL. Take it before querying, so a
+    page read while a post is being created is stored under the old version.
+    """
+    version = cache.get(LIST_VERSION_KEY)
+    if version is None:
+        version = _new_version()
+        cache.add(LIST_VERSION_KEY, version, VERSION_TIMEOUT)
+        version = cache.get(LIST_VERSION_KEY, version)
+    digest = hashlib.sha256(request.build_absolute_uri().encode()).hexdigest()
+    return f'posts:page:{version}:{digest}'
+
+
+def get_page(key):
+    return cache.get(key)
+
+
+def store_page(key, page):
+    cache.set(key, page, POST_CACHE_TIMEOUT)
+
+
+def _delete_now_and_on_commit(keys):
+    # The second delete drops anything a concurrent reader cached from the
+    # pre-commit rows in between
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def invalidate_posts(post_ids):
+    """Drop the cached bodies of `post_ids`."""
+    keys = [_version_key(post_id) for post_id in post_ids]
+    if keys:
+        _delete_now_and_on_commit(keys)
+
+
+def invalidate_post_list():
+    _delete_now_and_on_commit([LIST_VERSION_KEY])
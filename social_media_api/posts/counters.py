@@ -0,0 +1,45 @@
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from .models import Post, Comment, Like
+
+
+def adjust_counter(post_id, field, delta):
+    """
+    Atomically add `delta` to a post counter without reading the row.
+    Decrements never take a counter below zero, since rows created outside
+    the API (admin, shell) were never counted.
+    """
+    posts = Post.objects.filter(pk=post_id)
+    if delta < 0:
+        posts = posts.filter(**{f'{field}__gt': 0})
+    posts.update(**{field: F(field) + delta})
+
+
+def _count_subquery(model):
+    counts = (model.objects.filter(post=OuterRef('pk'))
+              .order_by().values('post').annotate(total=Count('pk')).values('total'))
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def reconcile_post_counters(queryset=None):
+    """
+    Recompute likes_count and comments_count for posts whose stored values
+    drifted from the Like and Comment tables. Returns the number of fixed posts.
+    """
+    if queryset is None:
+        queryset = Post.objects.all()
+    drifted = queryset.annotate(
+        actual_likes=_count_subquery(Like),
+        actual_comments=_count_subquery(Comment),
+    ).exclude(
+        likes_count=F('actual_likes'),
+        comments_count=F('actual_comments'),
+    ).values_list('pk', flat=True)
+
+    drifted_ids = list(drifted)
+    if drifted_ids:
+        Post.objects.filter(pk__in=drifted_ids).update(
+            likes_count=_count_subquery(Like),
+            comments_count=_count_subquery(Comment),
+        )
+    return len(drifted_ids)
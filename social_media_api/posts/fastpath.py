@@ -0,0 +1,76 @@
+from django.conf import settings
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from rest_framework import serializers
+from .models import Comment
+
+# Builds PostSerializer's output straight from .values() rows for the hot
+# list endpoints, skipping per-field serializer dispatch. The output must
+# match PostSerializer/CommentSerializer byte for byte (see
+# posts.tests.FastPathTests); fall back with POSTS_FAST_SERIALIZATION = False.
+FAST_SERIALIZATION = getattr(settings, 'POSTS_FAST_SERIALIZATION', True)
+
+POST_VALUES = ('id', 'title', 'content', 'author__username', 'created_at', 'updated_at',
+               'comments_count', 'likes_count')
+COMMENT_VALUES = ('id', 'post_id', 'author__username', 'content', 'created_at', 'updated_at')
+
+# DRF's own formatting, applied without a bound field
+_datetime = serializers.DateTimeField().to_representation
+
+
+def post_rows(queryset):
+    """
+    `queryset` as rows for serialize_posts(). Annotations (is_liked, the
+    feed position, search rank) are kept, as cursor pagination needs them.
+    """
+    fields = POST_VALUES + tuple(queryset.query.annotation_select)
+    return queryset.prefetch_related(None).values(*fields)
+
+
+def comment_previews(post_ids, limit):
+    """The latest `limit` comments of each post as {post_id: [comment data]}, in one query."""
+    if not post_ids or limit <= 0:
+        return {}
+    rows = (Comment.objects.filter(post_id__in=post_ids)
+            .annotate(preview_rank=Window(RowNumber(), partition_by=F('post_id'),
+                                          order_by=(F('created_at').desc(), F('id').desc())))
+            .filter(preview_rank__lte=limit)
+            .order_by('post_id', '-created_at', '-id')
+            .values(*COMMENT_VALUES))
+    previews = {}
+    for row in rows:
+        previews.setdefault(row['post_id'], []).append({
+            'id': row['id'],
+            'post': row['post_id'],
+            'author': row['author__username'],
+            'content': row['content'],
+            'created_at': _datetime(row['created_at']),
+            'updated_at': _datetime(row['updated_at']),
+        })
+    return previews
+
+
+def attach_comment_previews(rows, comment_limit):
+    """Store each row's comment preview on row['comments'], in one query."""
+    previews = comment_previews([row['id'] for row in rows], comment_limit)
+    for row in rows:
+        row['comments'] = previews.get(row['id'], [])
+    return rows
+
+
+def serialize_posts(rows, comment_limit):
+    """PostSerializer(many=True).data for post_rows() rows."""
+    rows = list(rows)
+    attach_comment_previews([row for row in rows if 'comments' not in row], comment_limit)
+    return [{
+        'id': row['id'],
+        'title': row['title'],
+        'content': row['content'],
+        'author': row['author__username'],
+        'created_at': _datetime(row['created_at']),
+        'updated_at': _datetime(row['updated_at']),
+        'comments': row['comments'],
+        'comments_count': row['comments_count'],
+        'likes_count': row['likes_count'],
+        'is_liked': bool(row.get('is_liked', False)),
+    } for row in rows]
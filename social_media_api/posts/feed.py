@@ -0,0 +1,71 @@
+from django.conf import settings
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from accounts.follows import get_following_ids
+from .models import FeedEntry, Post
+
+# Number of an author's most recent posts copied into a feed when following them
+FEED_BACKFILL_LIMIT = getattr(settings, 'FEED_BACKFILL_LIMIT', 500)
+FEED_BATCH_SIZE = 1000
+
+
+def _insert_entries(entries):
+    batch = []
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) >= FEED_BATCH_SIZE:
+            FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def fan_out_post(post):
+    """Write a new post into the feed of every follower of its author."""
+    follower_ids = post.author.followers.values_list('id', flat=True)
+    _insert_entries(
+        FeedEntry(user_id=follower_id, post_id=post.id, created_at=post.created_at)
+        for follower_id in follower_ids.iterator(chunk_size=FEED_BATCH_SIZE)
+    )
+
+
+def backfill_feed(user, author, limit=FEED_BACKFILL_LIMIT):
+    """Copy the recent posts of a newly followed author into the user's feed."""
+    posts = (Post.objects.filter(author=author)
+             .order_by('-created_at')
+             .values_list('id', 'created_at')[:limit])
+    _insert_entries(
+        FeedEntry(user_id=user.id, post_id=post_id, created_at=created_at)
+        for post_id, created_at in posts
+    )
+
+
+def backfill_feed_many(user, author_ids, limit=FEED_BACKFILL_LIMIT):
+    """backfill_feed() for several authors in one query."""
+    if not author_ids:
+        return
+    posts = (Post.objects.filter(author_id__in=author_ids)
+             .annotate(rank=Window(RowNumber(), partition_by=F('author_id'), order_by=F('created_at').desc()))
+             .filter(rank__lte=limit)
+             .values_list('id', 'created_at'))
+    _insert_entries(
+        FeedEntry(user_id=user.id, post_id=post_id, created_at=created_at)
+        for post_id, created_at in posts.iterator(chunk_size=FEED_BATCH_SIZE)
+    )
+
+
+def prune_feed(user, author):
+    """Remove an unfollowed author's posts from the user's feed."""
+    FeedEntry.objects.filter(user=user, post__author=author).delete()
+
+
+def prune_feed_many(user, author_ids):
+    if author_ids:
+        FeedEntry.objects.filter(user=user, post__author_id__in=author_ids).delete()
+
+
+def rebuild_feed(user, limit=FEED_BACKFILL_LIMIT):
+    """Drop and recompute a user's feed from the accounts they follow."""
+    FeedEntry.objects.filter(user=user).delete()
+    for author_id in get_following_ids(user.id):
+        backfill_feed(user, author_id, limit=limit)
@@ -0,0 +1,162 @@
+from django.db import connections, router, transaction
+from django.db.models import F
+from django.utils import timezone
+from notifications.outbox import enqueue_notifications
+from .cache import invalidate_posts
+from .models import Like, Post
+
+# Likes are written without loading the post: an INSERT ... SELECT that
+# skips rows which already exist, then one counter UPDATE that also returns
+# the authors to notify. Repeated likes and unlikes are no-ops, so clients
+# can safely retry them.
+
+MAX_BATCH_ACTIONS = 100
+# Largest value of a BigAutoField. Larger ids cannot exist, and passing one
+# to the raw SQL below overflows the driver's integer conversion
+MAX_POST_ID = 2 ** 63 - 1
+
+LIKE = 'like'
+UNLIKE = 'unlike'
+
+LIKED = 'liked'
+ALREADY_LIKED = 'already_liked'
+UNLIKED = 'unliked'
+NOT_LIKED = 'not_liked'
+NOT_FOUND = 'not_found'
+
+
+def _connection():
+    return connections[router.db_for_write(Like)]
+
+
+def _supports_returning(connection):
+    # INSERT ... ON CONFLICT DO NOTHING RETURNING and UPDATE/DELETE ... RETURNING
+    return connection.vendor in ('postgresql', 'sqlite') and connection.features.can_return_columns_from_insert
+
+
+def _in_clause(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def _insert_likes(connection, user_id, post_ids, liked_at):
+    """Insert the missing likes; returns the post ids that were inserted."""
+    like_table = connection.ops.quote_name(Like._meta.db_table)
+    post_table = connection.ops.quote_name(Post._meta.db_table)
+    now = connection.ops.adapt_datetimefield_value(liked_at)
+    select = (f'INSERT {{ignore}}INTO {like_table} (user_id, post_id, created_at) '
+              f'SELECT %s, id, %s FROM {post_table} WHERE id IN ({_in_clause(post_ids)})')
+    params = [user_id, now, *post_ids]
+
+    with connection.cursor() as cursor:
+        if _supports_returning(connection):
+            cursor.execute(select.format(ignore='') + ' ON CONFLICT (user_id, post_id) DO NOTHING RETURNING post_id',
+                           params)
+            return {row[0] for row in cursor.fetchall()}
+        if connection.vendor == 'mysql':
+            existing = set(Like.objects.filter(user_id=user_id, post_id__in=post_ids)
+                           .values_list('post_id', flat=True))
+            cursor.execute(select.format(ignore='IGNORE '), params)
+            if cursor.rowcount == 0:
+                return set()
+            return (set(Like.objects.filter(user_id=user_id, post_id__in=post_ids)
+                        .values_list('post_id', flat=True)) - existing)
+
+    # Any other backend: one savepoint-guarded insert per post
+    inserted = set()
+    for post_id in Post.objects.filter(pk__in=post_ids).values_list('pk', flat=True):
+        _, created = Like.objects.get_or_create(user_id=user_id, post_id=post_id)
+        if created:
+            inserted.add(post_id)
+    return inserted
+
+
+def _delete_likes(connection, user_id, post_ids):
+    """Delete the user's likes of `post_ids`; returns the post ids that were unliked."""
+    if _supports_returning(connection):
+        like_table = connection.ops.quote_name(Like._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {like_table} WHERE user_id = %s AND post_id IN ({_in_clause(post_ids)}) '
+                           f'RETURNING post_id', [user_id, *post_ids])
+            return {row[0] for row in cursor.fetchall()}
+    likes = Like.objects.filter(user_id=user_id, post_id__in=post_ids)
+    deleted = set(likes.select_for_update().values_list('post_id', flat=True))
+    likes.filter(post_id__in=deleted).delete()
+    return deleted
+
+
+def _adjust_likes_count(connection, post_ids, delta):
+    """Add `delta` to likes_count of `post_ids`; returns {post_id: author_id}."""
+    if _supports_returning(connection):
+        post_table = connection.ops.quote_name(Post._meta.db_table)
+        guard = ' AND likes_count > 0' if delta < 0 else ''
+        with connection.cursor() as cursor:
+            cursor.execute(f'UPDATE {post_table} SET likes_count = likes_count + %s '
+                           f'WHERE id IN ({_in_clause(post_ids)}){guard} RETURNING id, author_id',
+                           [delta, *post_ids])
+            return dict(cursor.fetchall())
+    posts = Post.objects.filter(pk__in=post_ids)
+    (posts.filter(likes_count__gt=0) if delta < 0 else posts).update(likes_count=F('likes_count') + delta)
+    return dict(posts.values_list('pk', 'author_id'))
+
+
+def like_posts(user, post_ids):
+    """
+    Like each post in `post_ids`, bumping its counter and queueing a
+    notification for its author. Returns the set of newly liked post ids.
+    """
+    post_ids = sorted(set(post_ids))
+    if not post_ids:
+        return set()
+    connection = _connection()
+    # The queued notifications carry the time of the like, never later than
+    # Like.created_at, so aggregation can count likers from the Like table
+    liked_at = timezone.now()
+    with transaction.atomic(using=connection.alias):
+        inserted = _insert_likes(connection, user.id, post_ids, liked_at)
+        if inserted:
+            authors = _adjust_likes_count(connection, sorted(inserted), 1)
+            enqueue_notifications(user.id, 'liked', Post, authors, created_at=liked_at)
+            invalidate_posts(inserted)
+    return inserted
+
+
+def unlike_posts(user, post_ids):
+    """Remove the user's likes of `post_ids`. Returns the set of unliked post ids."""
+    post_ids = sorted(set(post_ids))
+    if not post_ids:
+        return set()
+    connection = _connection()
+    with transaction.atomic(using=connection.alias):
+        deleted = _delete_likes(connection, user.id, post_ids)
+        if deleted:
+            _adjust_likes_count(connection, sorted(deleted), -1)
+            invalidate_posts(deleted)
+    return deleted
+
+
+def apply_like_actions(user, actions):
+    """
+    Replay queued (post_id, action) pairs in order; for each post only its
+    last action counts. Returns the outcome of each post's final action.
+    """
+    final = {}
+    for post_id, action in actions:
+        final.pop(post_id, None)
+        final[post_id] = action
+    to_like = [post_id for post_id, action in final.items() if action == LIKE]
+    to_unlike = [post_id for post_id, action in final.items() if action == UNLIKE]
+
+    with transaction.atomic(using=_connection().alias):
+        existing = set(Post.objects.filter(pk__in=final).values_list('pk', flat=True))
+        liked = like_posts(user, to_like)
+        unliked = unlike_posts(user, to_unlike)
+
+    outcomes = {}
+    for post_id, action in final.items():
+        if post_id not in existing:
+            outcomes[post_id] = NOT_FOUND
+        elif action == LIKE:
+            outcomes[post_id] = LIKED if post_id in liked else ALREADY_LIKED
+        else:
+            outcomes[post_id] = UNLIKED if post_id in unliked else NOT_LIKED
+    return outcomes
@@ -0,0 +1,26 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from posts.feed import FEED_BACKFILL_LIMIT, rebuild_feed
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the materialized home feeds from the follow graph'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', dest='usernames',
+                            help='Only rebuild the feed of this username (repeatable)')
+        parser.add_argument('--limit', type=int, default=FEED_BACKFILL_LIMIT,
+                            help='Posts copied per followed author')
+
+    def handle(self, *args, **options):
+        users = User.objects.all()
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+
+        count = 0
+        for user in users.iterator():
+            rebuild_feed(user, limit=options['limit'])
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} feed(s)'))
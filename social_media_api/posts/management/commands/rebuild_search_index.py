@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+from posts.search import install_search_index
+
+
+class Command(BaseCommand):
+    help = 'Recreates the full-text search index for posts (e.g. after a SQLite table rebuild)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        install_search_index(connection)
+        self.stdout.write(self.style.SUCCESS(f'Search index installed for {connection.vendor}'))
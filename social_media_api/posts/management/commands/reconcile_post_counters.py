@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+from posts.counters import reconcile_post_counters
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Fixes drift in the denormalized likes_count and comments_count columns'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Number of post ids checked per statement')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        max_id = Post.objects.aggregate(max_id=Max('pk'))['max_id'] or 0
+
+        fixed = 0
+        for start in range(0, max_id + 1, chunk_size):
+            chunk = Post.objects.filter(pk__gte=start, pk__lt=start + chunk_size)
+            fixed += reconcile_post_counters(chunk)
+        self.stdout.write(self.style.SUCCESS(f'Reconciled {fixed} post(s)'))
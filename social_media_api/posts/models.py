@@ -5,12 +5,34 @@ from django.contrib.contenttypes.models import ContentType
 
 User = get_user_model()
 
+class PostQuerySet(models.QuerySet):
+    def with_is_liked(self, user):
+        # Resolve the viewer's likes for a whole page in the same query
+        if user is None or user.is_anonymous:
+            return self
+        return self.annotate(is_liked=models.Exists(
+            Like.objects.filter(post=models.OuterRef('pk'), user=user)
+        ))
+
+    def with_comment_preview(self, limit):
+        # Latest `limit` comments per post for the whole page in one windowed
+        # query, stored on post.comment_preview
+        comments = Comment.objects.select_related('author').order_by('-created_at', '-id')
+        return self.prefetch_related(models.Prefetch(
+            'comments', queryset=comments[:limit], to_attr='comment_preview'
+        ))
+
 class Post(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='posts')
     title = models.CharField(max_length=200)
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Denormalized counters, kept in step by posts.counters
+    likes_count = models.PositiveIntegerField(default=0)
+    comments_count = models.PositiveIntegerField(default=0)
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         ordering = ['-created_at']
@@ -27,6 +49,10 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Comment previews and notification aggregation read a post's latest comments
+            models.Index(fields=['post', 'created_at'], name='posts_comment_post_created_idx'),
+        ]
 
     def __str__(self):
         return f'Comment by {self.author} on {self.post}'
@@ -39,6 +65,31 @@ class Like(models.Model):
     class Meta:
         unique_together = ('user', 'post')
         ordering = ['-created_at']
+        indexes = [
+            # Notification aggregation counts a post's likers since a point in time
+            models.Index(fields=['post', 'created_at'], name='posts_like_post_created_idx'),
+        ]
 
     def __str__(self):
         return f'{self.user.username} likes {self.post.title}'
+
+class FeedEntry(models.Model):
+    # Materialized home feed row, written when a post is created (fan-out on write)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='feed_entries')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='feed_entries')
+    # Copy of post.created_at so a feed page is a single range scan on the index below
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('user', 'post')
+        ordering = ['-created_at']
+        indexes = [
+            # Notification aggregation counts a post's likers since a point in time
+            models.Index(fields=['post', 'created_at'], name='posts_like_post_created_idx'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-post'], name='posts_feed_user_created_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.post} in feed of {self.user}'
@@ -0,0 +1,159 @@
+import re
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+from .models import Post
+
+# Indexed full-text search for posts.
+#
+# PostgreSQL keeps a weighted tsvector in a generated column with a GIN index.
+# SQLite keeps an external-content FTS5 table in step with triggers. Other
+# backends fall back to icontains matching.
+
+MAX_SEARCH_TERMS = 8
+
+POSTGRES_INSTALL = [
+    """
+    ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(content, '')), 'B')
+    ) STORED
+    """,
+    'CREATE INDEX IF NOT EXISTS {table}_search_idx ON {table} USING gin (search_vector)',
+]
+POSTGRES_UNINSTALL = [
+    'DROP INDEX IF EXISTS {table}_search_idx',
+    'ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector',
+]
+
+SQLITE_INSTALL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5(
+        title, content, content='{table}', content_rowid='id',
+        tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN
+        INSERT INTO {table}_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN
+        INSERT INTO {table}_fts({table}_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE OF title, content ON {table} BEGIN
+        INSERT INTO {table}_fts({table}_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO {table}_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END
+    """,
+    "INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')",
+]
+SQLITE_UNINSTALL = [
+    'DROP TRIGGER IF EXISTS {table}_fts_insert',
+    'DROP TRIGGER IF EXISTS {table}_fts_delete',
+    'DROP TRIGGER IF EXISTS {table}_fts_update',
+    'DROP TABLE IF EXISTS {table}_fts',
+]
+
+
+def _run(connection, statements, table):
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement.format(table=table))
+
+
+def install_search_index(connection, table=Post._meta.db_table):
+    """Create (or repair) the search index for the connection's backend."""
+    if connection.vendor == 'postgresql':
+        _run(connection, POSTGRES_INSTALL, table)
+    elif connection.vendor == 'sqlite':
+        _run(connection, SQLITE_INSTALL, table)
+
+
+def uninstall_search_index(connection, table=Post._meta.db_table):
+    if connection.vendor == 'postgresql':
+        _run(connection, POSTGRES_UNINSTALL, table)
+    elif connection.vendor == 'sqlite':
+        _run(connection, SQLITE_UNINSTALL, table)
+
+
+def parse_terms(query):
+    return re.findall(r'\w+', query.lower())[:MAX_SEARCH_TERMS]
+
+
+def search_posts(queryset, query):
+    """
+    Filter `queryset` to posts matching every term of `query` (each term is
+    also matched as a prefix) and annotate a `search_rank`, higher is better.
+    """
+    terms = parse_terms(query)
+    if not terms:
+        return queryset.none()
+
+    table = queryset.model._meta.db_table
+    vendor = connections[queryset.db].vendor
+
+    if vendor == 'postgresql':
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        return queryset.alias(
+            search_match=RawSQL(
+                f"{table}.search_vector @@ to_tsquery('english', %s)",
+                (tsquery,), output_field=BooleanField(),
+            ),
+        ).filter(search_match=True).annotate(
+            search_rank=RawSQL(
+                f"ts_rank({table}.search_vector, to_tsquery('english', %s))",
+                (tsquery,), output_field=FloatField(),
+            ),
+        )
+
+    if vendor == 'sqlite':
+        match = ' AND '.join(f'"{term}"*' for term in terms)
+        return queryset.filter(
+            pk__in=RawSQL(f'SELECT rowid FROM {table}_fts WHERE {table}_fts MATCH %s', (match,)),
+        ).annotate(
+            # bm25() is lower for better matches; title hits weigh double
+            search_rank=RawSQL(
+                f'SELECT -bm25({table}_fts, 2.0, 1.0) FROM {table}_fts '
+                f'WHERE {table}_fts MATCH %s AND rowid = {table}.id',
+                (match,), output_field=FloatField(),
+            ),
+        )
+
+    condition = Q()
+    for term in terms:
+        condition &= Q(title__icontains=term) | Q(content__icontains=term)
+    return queryset.filter(condition).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+class PostSearchFilter(filters.OrderingFilter):
+    """
+    `?q=` full-text search ordered by relevance. Also handles `?ordering=`,
+    so it replaces both SearchFilter and OrderingFilter on a view; an explicit
+    ordering wins over relevance. `?search=` is accepted as an alias.
+    """
+    search_param = 'q'
+    legacy_search_param = 'search'
+    rank_ordering = ('-search_rank', '-id')
+
+    def get_search_query(self, request):
+        params = request.query_params
+        return params.get(self.search_param) or params.get(self.legacy_search_param) or ''
+
+    def get_ordering(self, request, queryset, view):
+        if self.get_search_query(request).strip() and not request.query_params.get(self.ordering_param):
+            return self.rank_ordering
+        return super().get_ordering(request, queryset, view)
+
+    def filter_queryset(self, request, queryset, view):
+        query = self.get_search_query(request).strip()
+        if query:
+            queryset = search_posts(queryset, query)
+        return super().filter_queryset(request, queryset, view)
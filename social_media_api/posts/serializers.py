@@ -1,6 +1,24 @@
+from django.conf import settings
 from rest_framework import serializers
+from .likes import LIKE, MAX_BATCH_ACTIONS, MAX_POST_ID, UNLIKE
 from .models import Post, Comment, Like
 
+# Number of latest comments embedded in each post; clients can ask for
+# more (up to the maximum) with ?comments=<n>
+COMMENT_PREVIEW_SIZE = getattr(settings, 'COMMENT_PREVIEW_SIZE', 3)
+MAX_COMMENT_PREVIEW_SIZE = getattr(settings, 'MAX_COMMENT_PREVIEW_SIZE', 20)
+COMMENT_PREVIEW_QUERY_PARAM = 'comments'
+
+
+def get_comment_preview_limit(request):
+    if request is None:
+        return COMMENT_PREVIEW_SIZE
+    try:
+        limit = int(request.query_params.get(COMMENT_PREVIEW_QUERY_PARAM, COMMENT_PREVIEW_SIZE))
+    except (TypeError, ValueError):
+        return COMMENT_PREVIEW_SIZE
+    return max(0, min(limit, MAX_COMMENT_PREVIEW_SIZE))
+
 class CommentSerializer(serializers.ModelSerializer):
     author = serializers.ReadOnlyField(source='author.username')
 
@@ -11,25 +29,37 @@ class CommentSerializer(serializers.ModelSerializer):
 
 class PostSerializer(serializers.ModelSerializer):
     author = serializers.ReadOnlyField(source='author.username')
-    comments = CommentSerializer(many=True, read_only=True)
-    comments_count = serializers.SerializerMethodField()
-    likes_count = serializers.SerializerMethodField()
+    comments = serializers.SerializerMethodField()
     is_liked = serializers.SerializerMethodField()
 
     class Meta:
         model = Post
         fields = ['id', 'title', 'content', 'author', 'created_at', 
                  'updated_at', 'comments', 'comments_count', 'likes_count', 'is_liked']
-        read_only_fields = ['created_at', 'updated_at']
+        read_only_fields = ['created_at', 'updated_at', 'comments_count', 'likes_count']
 
-    def get_comments_count(self, obj):
-        return obj.comments.count()
+    def get_comments(self, obj):
+        # Only the latest comments are embedded; the full thread is served
+        # by CommentViewSet (?post=<id>)
+        comments = getattr(obj, 'comment_preview', None)
+        if comments is None:
+            limit = get_comment_preview_limit(self.context.get('request'))
+            comments = obj.comments.select_related('author').order_by('-created_at', '-id')[:limit]
+        return CommentSerializer(comments, many=True, context=self.context).data
 
-    def get_likes_count(self, obj):
-        return obj.likes.count()
-    
     def get_is_liked(self, obj):
+        # Views annotate is_liked for the whole queryset; fall back to a
+        # lookup for instances that were not loaded through them
+        if hasattr(obj, 'is_liked'):
+            return obj.is_liked
         user = self.context['request'].user
         if user.is_anonymous:
             return False
-        return obj.likes.filter(user=user).exists()
\ No newline at end of file
+        return obj.likes.filter(user=user).exists()
+
+class LikeActionSerializer(serializers.Serializer):
+    post = serializers.IntegerField(min_value=1, max_value=MAX_POST_ID)
+    action = serializers.ChoiceField(choices=[LIKE, UNLIKE])
+
+class LikeBatchSerializer(serializers.Serializer):
+    actions = LikeActionSerializer(many=True, allow_empty=False, max_length=MAX_BATCH_ACTIONS)
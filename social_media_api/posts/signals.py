@@ -0,0 +1,30 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .cache import invalidate_post_list, invalidate_posts
+from .feed import fan_out_post
+from .models import Post, Comment, Like
+
+
+@receiver(post_save, sender=Post)
+def fan_out_new_post(sender, instance, created, raw=False, **kwargs):
+    # Runs in the same transaction as the post insert so the feed never
+    # references a post that was rolled back
+    if created and not raw:
+        fan_out_post(instance)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_cached_post(sender, instance, created=False, **kwargs):
+    invalidate_posts([instance.pk])
+    if created or kwargs['signal'] is post_delete:
+        invalidate_post_list()
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=Like)
+@receiver(post_delete, sender=Like)
+def invalidate_commented_post(sender, instance, **kwargs):
+    # Covers the embedded comment preview and the counters
+    invalidate_posts([instance.post_id])
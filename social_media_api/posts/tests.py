@@ -1,3 +1,457 @@
-from django.test import TestCase
+from io import StringIO
+from unittest.mock import patch
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIRequestFactory, APITestCase
+from rest_framework import status
+from django.contrib.auth import get_user_model
+from notifications.models import NotificationOutbox
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from social_media_api.renderers import FastJSONRenderer
+from .counters import reconcile_post_counters
+from .fastpath import post_rows, serialize_posts
+from .serializers import PostSerializer
+from .views import FastPostListMixin
+from .models import Post, Comment, Like, FeedEntry
 
-# Create your tests here.
+User = get_user_model()
+
+class FeedFanOutTests(APITestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author', password='testpass123')
+        self.follower = User.objects.create_user(username='follower', password='testpass123')
+        self.follower.following.add(self.author)
+
+    def test_new_post_is_written_to_follower_feeds(self):
+        self.client.force_authenticate(user=self.author)
+        response = self.client.post(reverse('post-list'), {'title': 'Hello', 'content': 'World'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(FeedEntry.objects.filter(user=self.follower, post_id=response.data['id']).exists())
+        self.assertFalse(FeedEntry.objects.filter(user=self.author).exists())
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        other = User.objects.create_user(username='other', password='testpass123')
+        post = Post.objects.create(author=other, title='Earlier', content='Post')
+        self.client.force_authenticate(user=self.follower)
+
+        self.client.post(reverse('follow-user', kwargs={'user_id': other.id}))
+        feed = self.client.get(reverse('feed'))
+        self.assertIn(post.id, [item['id'] for item in feed.data['results']])
+
+        self.client.post(reverse('unfollow-user', kwargs={'user_id': other.id}))
+        self.assertFalse(FeedEntry.objects.filter(user=self.follower, post=post).exists())
+
+    def test_feed_is_newest_first(self):
+        first = Post.objects.create(author=self.author, title='First', content='1')
+        second = Post.objects.create(author=self.author, title='Second', content='2')
+        self.client.force_authenticate(user=self.follower)
+        response = self.client.get(reverse('feed'))
+        self.assertEqual([item['id'] for item in response.data['results']], [second.id, first.id])
+
+class PaginationTests(APITestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author', password='testpass123')
+        self.posts = [
+            Post.objects.create(author=self.author, title=f'Post {i}', content='Content')
+            for i in range(5)
+        ]
+
+    def test_list_uses_cursor_pagination_without_count(self):
+        response = self.client.get(reverse('post-list'), {'page_size': 2})
+        self.assertNotIn('count', response.data)
+        self.assertIn('cursor=', response.data['next'])
+
+        seen = []
+        url = reverse('post-list') + '?page_size=2'
+        while url:
+            response = self.client.get(url)
+            seen.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, [post.id for post in reversed(self.posts)])
+
+    def test_cursor_is_stable_under_inserts(self):
+        first = self.client.get(reverse('post-list'), {'page_size': 2})
+        Post.objects.create(author=self.author, title='Newer', content='Content')
+        second = self.client.get(first.data['next'])
+        self.assertEqual(second.data['results'][0]['id'], self.posts[2].id)
+
+    def test_page_numbers_are_opt_in(self):
+        response = self.client.get(reverse('post-list'), {'page': 2, 'page_size': 2})
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_feed_cursor_pagination(self):
+        follower = User.objects.create_user(username='follower', password='testpass123')
+        self.client.force_authenticate(user=follower)
+        self.client.post(reverse('follow-user', kwargs={'user_id': self.author.id}))
+
+        first = self.client.get(reverse('feed'), {'page_size': 3})
+        second = self.client.get(first.data['next'])
+        ids = [item['id'] for item in first.data['results'] + second.data['results']]
+        self.assertEqual(ids, [post.id for post in reversed(self.posts)])
+
+class CounterTests(APITestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author', password='testpass123')
+        self.reader = User.objects.create_user(username='reader', password='testpass123')
+        self.post = Post.objects.create(author=self.author, title='Counted', content='Content')
+        self.client.force_authenticate(user=self.reader)
+
+    def test_like_and_unlike_update_counter(self):
+        url = reverse('post-like', kwargs={'pk': self.post.pk})
+        self.client.post(url)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+
+        self.client.delete(url)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 0)
+
+    def test_comment_create_and_destroy_update_counter(self):
+        response = self.client.post(reverse('comment-list'), {'post': self.post.pk, 'content': 'Nice'})
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+
+        self.client.delete(reverse('comment-detail', kwargs={'pk': response.data['id']}))
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 0)
+
+    def test_destroying_an_uncounted_comment_keeps_counter_at_zero(self):
+        comment = Comment.objects.create(post=self.post, author=self.reader, content='From the shell')
+        response = self.client.delete(reverse('comment-detail', kwargs={'pk': comment.pk}))
+        self.assertEqual(response.status_code, 204)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 0)
+
+    def test_serializer_reads_stored_counters(self):
+        Post.objects.filter(pk=self.post.pk).update(likes_count=7, comments_count=3)
+        response = self.client.get(reverse('post-detail', kwargs={'pk': self.post.pk}))
+        self.assertEqual(response.data['likes_count'], 7)
+        self.assertEqual(response.data['comments_count'], 3)
+
+    def test_reconcile_command_fixes_drift(self):
+        Like.objects.create(user=self.reader, post=self.post)
+        Post.objects.filter(pk=self.post.pk).update(comments_count=5)
+        call_command('reconcile_post_counters', stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.likes_count, self.post.comments_count), (1, 0))
+
+class IdempotentLikeTests(APITestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author', password='testpass123')
+        self.reader = User.objects.create_user(username='reader', password='testpass123')
+        self.posts = [Post.objects.create(author=self.author, title=f'Post {i}', content='Content') for i in range(3)]
+        self.client.force_authenticate(user=self.reader)
+
+    def test_repeated_like_is_a_no_op(self):
+        url = reverse('post-like', kwargs={'pk': self.posts[0].pk})
+        self.assertEqual(self.client.post(url).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.client.post(url).status_code, status.HTTP_200_OK)
+        self.posts[0].refresh_from_db()
+        self.assertEqual(self.posts[0].likes_count, 1)
+        self.assertEqual(NotificationOutbox.objects.filter(verb='liked').count(), 1)
+
+    def test_unlike_by_post_and_delete_is_idempotent(self):
+        Like.objects.create(user=self.reader, post=self.posts[0])
+        Post.objects.filter(pk=self.posts[0].pk).update(likes_count=1)
+        self.assertEqual(self.client.post(reverse('post-unlike', kwargs={'pk': self.posts[0].pk})).status_code,
+                         status.HTTP_200_OK)
+        self.assertEqual(self.client.delete(reverse('post-like', kwargs={'pk': self.posts[0].pk})).status_code,
+                         status.HTTP_200_OK)
+        self.posts[0].refresh_from_db()
+        self.assertEqual(self.posts[0].likes_count, 0)
+        self.assertFalse(Like.objects.exists())
+
+    def test_missing_post_is_404(self):
+        self.assertEqual(self.client.post(reverse('post-like', kwargs={'pk': 999999})).status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+    def test_like_does_not_load_the_post(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('post-like', kwargs={'pk': self.posts[0].pk}))
+        self.assertFalse([q for q in queries.captured_queries if q['sql'].startswith('SELECT')
+                          and 'posts_post' in q['sql'] and 'INSERT' not in q['sql']])
+
+    def test_batch_replays_actions_in_order(self):
+        Like.objects.create(user=self.reader, post=self.posts[1])
+        Post.objects.filter(pk=self.posts[1].pk).update(likes_count=1)
+        response = self.client.post(reverse('like-batch'), {'actions': [
+            {'post': self.posts[0].pk, 'action': 'like'},
+            {'post': self.posts[1].pk, 'action': 'like'},
+            {'post': self.posts[2].pk, 'action': 'like'},
+            {'post': self.posts[2].pk, 'action': 'unlike'},
+            {'post': 999999, 'action': 'like'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual({r['post']: r['status'] for r in response.data['results']}, {
+            self.posts[0].pk: 'liked', self.posts[1].pk: 'already_liked',
+            self.posts[2].pk: 'not_liked', 999999: 'not_found',
+        })
+        self.assertEqual(set(Like.objects.values_list('post_id', flat=True)), {self.posts[0].pk, self.posts[1].pk})
+        self.assertEqual(reconcile_post_counters(), 0)
+        self.assertEqual(NotificationOutbox.objects.filter(verb='liked').count(), 1)
+
+    def test_batch_rejects_unknown_actions(self):
+        response = self.client.post(reverse('like-batch'), {'actions': [{'post': 1, 'action': 'love'}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_out_of_range_ids_are_rejected(self):
+        response = self.client.post(reverse('like-batch'), {'actions': [{'post': 2 ** 70, 'action': 'like'}]},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        for method in (self.client.post, self.client.delete):
+            self.assertEqual(method(reverse('post-like', kwargs={'pk': 2 ** 70})).status_code,
+                             status.HTTP_404_NOT_FOUND)
+
+class PostCacheTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author', password='testpass123')
+        self.reader = User.objects.create_user(username='reader', password='testpass123')
+        self.posts = [Post.objects.create(author=self.author, title=f'Post {i}', content='Content') for i in range(3)]
+        self.detail = reverse('post-detail', kwargs={'pk': self.posts[0].pk})
+
+    def post_queries(self, url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        return response, [q for q in queries.captured_queries if 'posts_post' in q['sql']]
+
+    def test_retrieve_is_served_from_cache(self):
+        self.post_queries(self.detail)
+        response, queries = self.post_queries(self.detail)
+        self.assertEqual(response.data['title'], 'Post 0')
+        self.assertEqual(queries, [])
+
+    def test_retrieve_of_an_out_of_range_id_is_not_found(self):
+        response = self.client.get(reverse('post-detail', kwargs={'pk': 2 ** 70}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_is_liked_is_personal_on_a_shared_body(self):
+        Like.objects.create(user=self.reader, post=self.posts[0])
+        self.client.force_authenticate(user=self.reader)
+        self.assertTrue(self.client.get(self.detail).data['is_liked'])
+        self.client.force_authenticate(user=self.author)
+        self.assertFalse(self.client.get(self.detail).data['is_liked'])
+        self.client.force_authenticate(user=None)
+        self.assertFalse(self.client.get(self.detail).data['is_liked'])
+
+    def test_comments_and_likes_invalidate_the_post(self):
+        self.client.get(self.detail)
+        self.client.force_authenticate(user=self.reader)
+        self.client.post(reverse('comment-list'), {'post': self.posts[0].pk, 'content': 'Fresh'})
+        self.client.post(reverse('post-like', kwargs={'pk': self.posts[0].pk}))
+        response = self.client.get(self.detail)
+        self.assertEqual((response.data['comments_count'], response.data['likes_count']), (1, 1))
+        self.assertEqual(response.data['comments'][0]['content'], 'Fresh')
+
+    def test_update_invalidates_the_post(self):
+        self.client.get(self.detail)
+        self.client.force_authenticate(user=self.author)
+        self.client.patch(self.detail, {'title': 'Renamed'})
+        self.assertEqual(self.client.get(self.detail).data['title'], 'Renamed')
+
+    def test_unfiltered_list_is_cached_until_a_post_is_created(self):
+        self.post_queries(reverse('post-list'))
+        response, queries = self.post_queries(reverse('post-list'))
+        self.assertEqual(queries, [])
+        self.assertEqual(len(response.data['results']), 3)
+
+        Post.objects.create(author=self.author, title='Newest', content='Content')
+        response = self.client.get(reverse('post-list'))
+        self.assertEqual(response.data['results'][0]['title'], 'Newest')
+
+    def test_filtered_list_bypasses_the_cache(self):
+        self.post_queries(reverse('post-list'), {'author': self.author.pk})
+        _, queries = self.post_queries(reverse('post-list'), {'author': self.author.pk})
+        self.assertNotEqual(queries, [])
+
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author', password='testpass123')
+        self.reader = User.objects.create_user(username='reader', password='testpass123')
+        self.reader.following.add(self.author)
+        self.post = Post.objects.create(author=self.author, title='Cached', content='Content')
+        self.client.force_authenticate(user=self.reader)
+
+    def revalidate(self, url, response, **params):
+        return self.client.get(url, params, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_unchanged_responses_are_not_modified(self):
+        for url in [reverse('feed'), reverse('post-list'), reverse('post-detail', kwargs={'pk': self.post.pk})]:
+            response = self.client.get(url)
+            self.assertIn('ETag', response)
+            self.assertIn('Last-Modified', response)
+            not_modified = self.revalidate(url, response)
+            self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED, url)
+            self.assertEqual(not_modified.content, b'')
+
+    def test_likes_change_the_validator(self):
+        url = reverse('feed')
+        response = self.client.get(url)
+        self.client.post(reverse('post-like', kwargs={'pk': self.post.pk}))
+        self.assertEqual(self.revalidate(url, response).status_code, status.HTTP_200_OK)
+
+    def test_comment_edits_change_the_validator(self):
+        comment = Comment.objects.create(post=self.post, author=self.reader, content='First')
+        urls = [reverse('feed'), reverse('post-list'), reverse('post-detail', kwargs={'pk': self.post.pk})]
+        responses = [self.client.get(url) for url in urls]
+        self.client.patch(reverse('comment-detail', kwargs={'pk': comment.pk}), {'content': 'Edited'})
+        for url, response in zip(urls, responses):
+            self.assertEqual(self.revalidate(url, response).status_code, status.HTTP_200_OK, url)
+
+    def test_validators_are_per_user(self):
+        url = reverse('post-detail', kwargs={'pk': self.post.pk})
+        response = self.client.get(url)
+        self.client.force_authenticate(user=self.author)
+        self.assertEqual(self.revalidate(url, response).status_code, status.HTTP_200_OK)
+
+    def test_if_modified_since(self):
+        url = reverse('post-detail', kwargs={'pk': self.post.pk})
+        response = self.client.get(url)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code,
+                         status.HTTP_304_NOT_MODIFIED)
+
+class FastPathTests(APITestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author', password='testpass123')
+        self.reader = User.objects.create_user(username='reader', password='testpass123')
+        self.reader.following.add(self.author)
+        self.posts = [
+            Post.objects.create(author=self.author, title=f'Post {i} \u2028 caf\u00e9', content='Content \U0001f600')
+            for i in range(4)
+        ]
+        for i in range(5):
+            Comment.objects.create(post=self.posts[1], author=self.reader, content=f'Comment {i}')
+        Like.objects.create(user=self.reader, post=self.posts[2])
+        self.client.force_authenticate(user=self.reader)
+
+    def test_rows_match_the_serializer(self):
+        request = Request(APIRequestFactory().get('/'))
+        request.user = self.reader
+        queryset = Post.objects.select_related('author').with_is_liked(self.reader).with_comment_preview(3).order_by('-id')
+        expected = PostSerializer(queryset, many=True, context={'request': request}).data
+        actual = serialize_posts(post_rows(queryset), 3)
+        self.assertEqual(actual, expected)
+        self.assertEqual(FastJSONRenderer().render(actual), JSONRenderer().render(expected))
+
+    def test_endpoints_render_the_same_bytes_on_both_paths(self):
+        for url in [reverse('feed'), reverse('post-list') + '?author=' + str(self.author.pk)]:
+            fast = self.client.get(url).content
+            with patch.object(FastPostListMixin, 'fast_serialization', False):
+                slow = self.client.get(url).content
+            self.assertEqual(fast, slow, url)
+
+    def test_renderer_falls_back_for_indented_output(self):
+        self.assertEqual(FastJSONRenderer().render({'a': 1}, 'application/json; indent=2'),
+                         JSONRenderer().render({'a': 1}, 'application/json; indent=2'))
+
+class IsLikedTests(APITestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author', password='testpass123')
+        self.reader = User.objects.create_user(username='reader', password='testpass123')
+        self.posts = [
+            Post.objects.create(author=self.author, title=f'Post {i}', content='Content')
+            for i in range(4)
+        ]
+        Like.objects.create(user=self.reader, post=self.posts[1])
+
+    def test_is_liked_reflects_viewer(self):
+        self.client.force_authenticate(user=self.reader)
+        response = self.client.get(reverse('post-list'))
+        liked = {item['id']: item['is_liked'] for item in response.data['results']}
+        self.assertEqual(liked, {post.id: post == self.posts[1] for post in self.posts})
+
+        response = self.client.get(reverse('post-detail', kwargs={'pk': self.posts[1].pk}))
+        self.assertTrue(response.data['is_liked'])
+
+    def test_is_liked_does_not_add_queries_per_post(self):
+        self.client.force_authenticate(user=self.reader)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(reverse('post-list'), {'page_size': 1})
+        with CaptureQueriesContext(connection) as large:
+            self.client.get(reverse('post-list'), {'page_size': 4})
+
+        def like_queries(context):
+            return [q for q in context.captured_queries if 'posts_like' in q['sql']]
+        self.assertEqual(len(like_queries(small)), 1)
+        self.assertEqual(len(like_queries(large)), 1)
+
+    def test_anonymous_is_never_liked(self):
+        response = self.client.get(reverse('post-list'))
+        self.assertFalse(any(item['is_liked'] for item in response.data['results']))
+
+class CommentPreviewTests(APITestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author', password='testpass123')
+        self.posts = [
+            Post.objects.create(author=self.author, title=f'Post {i}', content='Content')
+            for i in range(3)
+        ]
+        for post in self.posts:
+            for i in range(5):
+                Comment.objects.create(post=post, author=self.author, content=f'Comment {i}')
+
+    def test_list_embeds_latest_comments_only(self):
+        response = self.client.get(reverse('post-list'))
+        for item in response.data['results']:
+            self.assertEqual([c['content'] for c in item['comments']],
+                             ['Comment 4', 'Comment 3', 'Comment 2'])
+            self.assertEqual(item['comments'][0]['author'], 'author')
+
+    def test_clients_can_ask_for_more_comments(self):
+        response = self.client.get(reverse('post-list'), {'comments': 5})
+        self.assertEqual(len(response.data['results'][0]['comments']), 5)
+        response = self.client.get(reverse('post-list'), {'comments': 0})
+        self.assertEqual(response.data['results'][0]['comments'], [])
+
+    def test_preview_query_count_is_independent_of_page_size(self):
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(reverse('post-list'), {'page_size': 1})
+        with CaptureQueriesContext(connection) as large:
+            self.client.get(reverse('post-list'), {'page_size': 3})
+        self.assertEqual(len(small), len(large))
+
+    def test_full_thread_is_paginated_by_post(self):
+        response = self.client.get(reverse('comment-list'), {'post': self.posts[0].pk, 'page_size': 4})
+        self.assertEqual(len(response.data['results']), 4)
+        self.assertIsNotNone(response.data['next'])
+
+class SearchTests(APITestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author', password='testpass123')
+        self.title_hit = Post.objects.create(author=self.author, title='Django performance', content='Tips')
+        self.body_hit = Post.objects.create(author=self.author, title='Notes', content='Some django internals')
+        self.miss = Post.objects.create(author=self.author, title='Cooking', content='Pasta')
+
+    def search(self, **params):
+        response = self.client.get(reverse('post-list'), params)
+        return [item['id'] for item in response.data['results']]
+
+    def test_search_ranks_title_matches_first(self):
+        self.assertEqual(self.search(q='django'), [self.title_hit.id, self.body_hit.id])
+
+    def test_prefix_and_all_terms_match(self):
+        self.assertEqual(self.search(q='perf djan'), [self.title_hit.id])
+        self.assertEqual(self.search(q='past'), [self.miss.id])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.miss.title = 'Django pasta'
+        self.miss.save()
+        self.assertIn(self.miss.id, self.search(q='django'))
+        self.body_hit.delete()
+        self.assertNotIn(self.body_hit.id, self.search(q='internals'))
+
+    def test_legacy_search_param_and_explicit_ordering(self):
+        self.assertEqual(self.search(search='django', ordering='created_at'),
+                         [self.title_hit.id, self.body_hit.id])
+
+    def test_search_results_can_be_paged_by_cursor(self):
+        first = self.client.get(reverse('post-list'), {'q': 'django', 'page_size': 1})
+        second = self.client.get(first.data['next'])
+        self.assertEqual([item['id'] for item in first.data['results'] + second.data['results']],
+                         [self.title_hit.id, self.body_hit.id])
@@ -3,6 +3,7 @@ from rest_framework.routers import DefaultRouter
 from . import views
 
 router = DefaultRouter()
+router.APIRootView = views.APIRootView
 router.register(r'posts', views.PostViewSet)
 router.register(r'comments', views.CommentViewSet)
 
@@ -10,5 +11,6 @@ urlpatterns = [
     path('', include(router.urls)),
     path('feed/', views.FeedView.as_view(), name='feed'),
     path('posts/<int:pk>/like/', views.LikeView.as_view(), name='post-like'),
-    path('posts/<int:pk>/unlike/', views.LikeView.as_view(), name='post-unlike'),
+    path('posts/<int:pk>/unlike/', views.UnlikeView.as_view(), name='post-unlike'),
+    path('likes/batch/', views.LikeBatchView.as_view(), name='like-batch'),
 ]
\ No newline at end of file
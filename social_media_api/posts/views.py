@@ -1,13 +1,28 @@
-from rest_framework import viewsets, permissions, filters, generics, status
-from rest_framework.pagination import PageNumberPagination
+from rest_framework import viewsets, permissions, filters, generics, routers, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
+from django.http import Http404
 from django.shortcuts import get_object_or_404
+from django.db.models import BooleanField, F, Value
 from django.contrib.contenttypes.models import ContentType
-from .models import Post, Comment, Like
-from .serializers import PostSerializer, CommentSerializer
-from notifications.models import Notification
+from django.db import transaction
+from .models import Post, Comment
+from .cache import get_page, invalidate_posts, get_post_bodies, page_key, personalize, shared_body, store_page
+from .counters import adjust_counter
+from .fastpath import FAST_SERIALIZATION, attach_comment_previews, post_rows, serialize_posts
+from .likes import MAX_POST_ID, apply_like_actions, like_posts, unlike_posts
+from .search import PostSearchFilter
+from .serializers import (PostSerializer, CommentSerializer, LikeBatchSerializer, COMMENT_PREVIEW_QUERY_PARAM,
+                          get_comment_preview_limit)
+from notifications.outbox import enqueue_notification
+from social_media_api.conditional import ConditionalGetMixin
+from social_media_api.metrics import timed
+from social_media_api.pagination import CursorOrPageNumberPagination
+from social_media_api.replicas import ReplicaReadMixin, use_primary
+
+class APIRootView(routers.APIRootView):
+    query_budget = 0
 
 class IsAuthorOrReadOnly(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
@@ -15,93 +30,203 @@ class IsAuthorOrReadOnly(permissions.BasePermission):
             return True
         return obj.author == request.user
 
-class StandardResultsSetPagination(PageNumberPagination):
-    page_size = 10
-    page_size_query_param = 'page_size'
-    max_page_size = 100
+# Post validators: counters and is_liked change without touching updated_at
+POST_ETAG_FIELDS = ('id', 'updated_at', 'likes_count', 'comments_count', 'is_liked')
+
+def _comment_preview(post):
+    if isinstance(post, dict):
+        return [(comment['id'], comment['updated_at']) for comment in post.get('comments', ())]
+    return [(comment.pk, comment.updated_at) for comment in getattr(post, 'comment_preview', ())]
+
+class PostConditionalGetMixin(ConditionalGetMixin):
+    """Post validators that also cover the embedded comment preview."""
+    etag_fields = POST_ETAG_FIELDS
+
+    def get_etag_values(self, obj):
+        # Editing a comment changes the body but not the post's updated_at
+        return super().get_etag_values(obj) + tuple(_comment_preview(obj))
+
+    def get_modified_values(self, obj):
+        return super().get_modified_values(obj) + [updated_at for _, updated_at in _comment_preview(obj)]
+
+class FastPostListMixin:
+    """Lists posts from .values() rows through posts.fastpath when enabled."""
+    fast_serialization = FAST_SERIALIZATION
 
-class PostViewSet(viewsets.ModelViewSet):
+    def get_list_queryset(self, queryset):
+        return post_rows(queryset) if self.fast_serialization else queryset
+
+    def prepare_objects(self, objects):
+        # The validators need the previews, which rows do not carry
+        if self.fast_serialization:
+            attach_comment_previews(objects, get_comment_preview_limit(self.request))
+        return super().prepare_objects(objects)
+
+    def get_list_data(self, objects):
+        if self.fast_serialization:
+            with timed('serialize'):
+                return serialize_posts(objects, get_comment_preview_limit(self.request))
+        return super().get_list_data(objects)
+
+class PostViewSet(ReplicaReadMixin, FastPostListMixin, PostConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Post.objects.all()
     serializer_class = PostSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly]
-    pagination_class = StandardResultsSetPagination
-    filter_backends = [filters.SearchFilter, DjangoFilterBackend, filters.OrderingFilter]
-    search_fields = ['title', 'content']
+    pagination_class = CursorOrPageNumberPagination
+    filter_backends = [PostSearchFilter, DjangoFilterBackend]
     filterset_fields = ['author']
     ordering_fields = ['created_at', 'updated_at']
-    ordering = ['-created_at']
+    ordering = ['-created_at', '-id']
+    # List requests with only these parameters are served from the cache
+    cacheable_list_params = {'cursor', 'page', 'page_size', COMMENT_PREVIEW_QUERY_PARAM}
+    query_budget = 8
+    replica_actions = ('list',)
+
+    def get_queryset(self):
+        return Post.objects.select_related('author').with_is_liked(
+            self.request.user
+        ).with_comment_preview(get_comment_preview_limit(self.request))
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    def load_post_bodies(self, post_ids):
+        # is_liked is filled in per viewer by personalize(). The bodies are
+        # shared through the cache, so never build them from a lagging replica
+        posts = Post.objects.filter(pk__in=post_ids).select_related('author').with_comment_preview(
+            get_comment_preview_limit(self.request)
+        ).annotate(is_liked=Value(False, output_field=BooleanField()))
+        with use_primary():
+            return {data['id']: shared_body(data) for data in self.get_list_data(self.get_list_queryset(posts))}
+
+    def get_post_bodies(self, post_ids):
+        return get_post_bodies(post_ids, get_comment_preview_limit(self.request), self.load_post_bodies)
+
+    def list(self, request, *args, **kwargs):
+        if not set(request.query_params) <= self.cacheable_list_params:
+            return super().list(request, *args, **kwargs)
+
+        key = page_key(request)
+        page = get_page(key)
+        if page is None:
+            # Paginate ids only, on the primary like the bodies; the bodies
+            # come from the post cache
+            with use_primary():
+                posts = self.paginate_queryset(self.filter_queryset(Post.objects.only('id', 'created_at')))
+            page = dict(self.get_paginated_response([post.pk for post in posts]).data)
+            store_page(key, page)
+
+        bodies = self.get_post_bodies(page['results'])
+        results = personalize([bodies[post_id] for post_id in page['results'] if post_id in bodies], request.user)
+        return self.not_modified(results) or Response(dict(page, results=results))
+
     def retrieve(self, request, pk=None):
         ["generics.get_object_or_404(Post, pk=pk)"]
-        post = get_object_or_404(Post, pk=pk)
-        serializer = self.get_serializer(post)
-        return Response(serializer.data)
+        try:
+            post_id = int(pk)
+        except (TypeError, ValueError):
+            raise Http404
+        if not 0 < post_id <= MAX_POST_ID:
+            raise Http404
+        body = self.get_post_bodies([post_id]).get(post_id)
+        if body is None:
+            raise Http404
+        post = personalize([body], request.user)[0]
+        return self.not_modified([post]) or Response(post)
 
 class CommentViewSet(viewsets.ModelViewSet):
-    queryset = Comment.objects.all()
+    queryset = Comment.objects.select_related('author')
     serializer_class = CommentSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly]
-    pagination_class = StandardResultsSetPagination
+    pagination_class = CursorOrPageNumberPagination
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['post', 'author']
     ordering_fields = ['created_at']
-    ordering = ['-created_at']
+    ordering = ['-created_at', '-id']
+    query_budget = 7
 
+    @transaction.atomic
     def perform_create(self, serializer):
         comment = serializer.save(author=self.request.user)
-        # Create notification for post author
-        if comment.author != comment.post.author:
-            Notification.objects.create(
-                recipient=comment.post.author,
-                actor=self.request.user,
-                verb='commented on',
-                target=comment.post
-            )
-
-class FeedView(generics.ListAPIView):
+        adjust_counter(comment.post_id, 'comments_count', 1)
+        # Queue notification for post author, delivered by the outbox worker
+        enqueue_notification(comment.post.author_id, self.request.user.id, 'commented on', comment.post,
+                             created_at=comment.created_at)
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        old_post_id = serializer.instance.post_id
+        comment = serializer.save()
+        if comment.post_id != old_post_id:
+            invalidate_posts([old_post_id])
+            adjust_counter(old_post_id, 'comments_count', -1)
+            adjust_counter(comment.post_id, 'comments_count', 1)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        adjust_counter(instance.post_id, 'comments_count', -1)
+        instance.delete()
+
+class FeedView(ReplicaReadMixin, FastPostListMixin, PostConditionalGetMixin, generics.ListAPIView):
     serializer_class = PostSerializer
     permission_classes = [permissions.IsAuthenticated]
-    pagination_class = StandardResultsSetPagination
+    pagination_class = CursorOrPageNumberPagination
+    query_budget = 2
+    replica_actions = ('get',)
+    # The cursor is keyed on the feed entry's copy of created_at
+    ordering = ['-feed_created_at', '-id']
 
     def get_queryset(self):
-        following_users = self.request.user.following.all()
-        return Post.objects.filter(author__in=following_users).order_by('-created_at')
+        # Read the materialized feed instead of joining the follow table
+        return Post.objects.filter(
+            feed_entries__user=self.request.user
+        ).select_related('author').with_is_liked(
+            self.request.user
+        ).with_comment_preview(
+            get_comment_preview_limit(self.request)
+        ).annotate(
+            feed_created_at=F('feed_entries__created_at')
+        ).order_by(*self.ordering)
 
 class LikeView(APIView):
+    """Idempotent like (POST) and unlike (DELETE); neither loads the post."""
     permission_classes = [permissions.IsAuthenticated]
+    query_budget = 5
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # <int:pk> matches ids no post can have
+        if kwargs['pk'] > MAX_POST_ID:
+            raise Http404
 
     def post(self, request, pk):
-        post = get_object_or_404(Post, pk=pk)
-        like, created = Like.objects.get_or_create(user=request.user, post=post)
-        
-        if created:
-            # Create notification for post author
-            if request.user != post.author:
-                Notification.objects.create(
-                    recipient=post.author,
-                    actor=request.user,
-                    verb='liked',
-                    target=post
-                )
-            return Response({'message': 'Post liked'}, status=status.HTTP_201_CREATED)
-        
-        return Response(
-            {'message': 'You have already liked this post'},
-            status=status.HTTP_400_BAD_REQUEST
-        )
+        if like_posts(request.user, [pk]):
+            return Response({'message': 'Post liked', 'liked': True}, status=status.HTTP_201_CREATED)
+        # Nothing inserted: either already liked or no such post
+        get_object_or_404(Post.objects.values('pk'), pk=pk)
+        return Response({'message': 'You have already liked this post', 'liked': True}, status=status.HTTP_200_OK)
 
     def delete(self, request, pk):
-        post = get_object_or_404(Post, pk=pk)
-        like = Like.objects.filter(user=request.user, post=post).first()
-        
-        if like:
-            like.delete()
-            return Response({'message': 'Post unliked'}, status=status.HTTP_200_OK)
-        
-        return Response(
-            {'message': 'You have not liked this post'},
-            status=status.HTTP_400_BAD_REQUEST
-        )
+        if unlike_posts(request.user, [pk]):
+            return Response({'message': 'Post unliked', 'liked': False}, status=status.HTTP_200_OK)
+        get_object_or_404(Post.objects.values('pk'), pk=pk)
+        return Response({'message': 'You have not liked this post', 'liked': False}, status=status.HTTP_200_OK)
+
+class UnlikeView(LikeView):
+    # POST /posts/<pk>/unlike/ unlikes, for clients that cannot send DELETE
+    post = LikeView.delete
+
+class LikeBatchView(APIView):
+    """Replays likes and unlikes queued by offline clients."""
+    permission_classes = [permissions.IsAuthenticated]
+    query_budget = 8
+
+    def post(self, request):
+        serializer = LikeBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        outcomes = apply_like_actions(request.user, [
+            (action['post'], action['action']) for action in serializer.validated_data['actions']
+        ])
+        return Response({
+            'results': [{'post': post_id, 'status': outcome} for post_id, outcome in outcomes.items()],
+        }, status=status.HTTP_200_OK)
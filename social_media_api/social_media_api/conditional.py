@@ -0,0 +1,93 @@
+import hashlib
+from calendar import timegm
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+from .metrics import timed
+
+
+def _value(obj, field):
+    if isinstance(obj, dict):
+        return obj.get(field)
+    return getattr(obj, field, None)
+
+
+def _timestamp(value):
+    if isinstance(value, str):
+        value = parse_datetime(value)
+    return timegm(value.utctimetuple()) if value else None
+
+
+class ConditionalGetMixin:
+    """
+    ETag / Last-Modified validators for list and detail responses, checked
+    against If-None-Match / If-Modified-Since before serializing.
+
+    The ETag covers `etag_fields` of every object on the page plus the
+    requesting user; Last-Modified is the newest `modified_field`. Clients
+    should prefer If-None-Match: Last-Modified alone does not notice an
+    older object sliding into the page when one is deleted.
+    """
+    etag_fields = ('id', 'updated_at')
+    modified_field = 'updated_at'
+
+    def get_etag_values(self, obj):
+        return tuple(_value(obj, field) for field in self.etag_fields)
+
+    def get_modified_values(self, obj):
+        return [_value(obj, self.modified_field)]
+
+    def get_validators(self, objects):
+        digest = hashlib.sha256(str(self.request.user.pk).encode())
+        last_modified = None
+        for obj in objects:
+            digest.update(repr(self.get_etag_values(obj)).encode())
+            for value in self.get_modified_values(obj):
+                modified = _timestamp(value)
+                if modified is not None and (last_modified is None or modified > last_modified):
+                    last_modified = modified
+        return quote_etag(digest.hexdigest()), last_modified
+
+    def prepare_objects(self, objects):
+        """Hook to load what the validators need before they are computed."""
+        return objects
+
+    def not_modified(self, objects):
+        """Return a 304 response if the client's copy of `objects` is current, else None."""
+        etag, last_modified = self._validators = self.get_validators(objects)
+        return get_conditional_response(self.request, etag=etag, last_modified=last_modified)
+
+    def get_list_queryset(self, queryset):
+        """Hook to reshape the filtered queryset, e.g. into .values() rows."""
+        return queryset
+
+    def get_list_data(self, objects):
+        with timed('serialize'):
+            return self.get_serializer(objects, many=True).data
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.get_list_queryset(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        objects = self.prepare_objects(page if page is not None else list(queryset))
+        response = self.not_modified(objects)
+        if response is not None:
+            return response
+        data = self.get_list_data(objects)
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        validators = getattr(self, '_validators', None)
+        if validators is not None and response.status_code in (200, 304):
+            etag, last_modified = validators
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+            # Bodies are personal (is_liked, notifications): shared caches
+            # must not store them, clients must revalidate
+            patch_cache_control(response, private=True, no_cache=True)
+            patch_vary_headers(response, ['Authorization'])
+        return response
@@ -0,0 +1,292 @@
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import Http404, HttpResponse
+
+# Per-request timings (SQL, serialization, rendering) and process-wide
+# Prometheus histograms of them, labelled by URL name. Recording is a few
+# perf_counter() calls and list increments per request, so it stays on in
+# production.
+#
+# Each process keeps its own histograms. With several worker processes,
+# set METRICS_DIR: every process then writes a snapshot there at most
+# once per METRICS_FLUSH_INTERVAL seconds, and /metrics adds them up.
+
+METRICS_DIR = getattr(settings, 'METRICS_DIR', None)
+METRICS_FLUSH_INTERVAL = getattr(settings, 'METRICS_FLUSH_INTERVAL', 5)
+METRICS_ALLOWED_IPS = getattr(settings, 'METRICS_ALLOWED_IPS', ('127.0.0.1', '::1'))
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+_timings = ContextVar('request_timings', default=None)
+
+
+class Timings:
+    """What one request spent; durations are in seconds."""
+    __slots__ = ('queries', 'db', 'serialize', 'render', 'active')
+
+    def __init__(self):
+        self.queries = 0
+        self.db = self.serialize = self.render = 0.0
+        self.active = set()
+
+
+def start_request():
+    """Begin collecting timings for the current request; returns a token for end_request()."""
+    return _timings.set(Timings())
+
+
+def end_request(token):
+    timings = _timings.get()
+    _timings.reset(token)
+    return timings
+
+
+@contextmanager
+def timed(phase):
+    """
+    Add the block's duration, minus the SQL it ran, to `phase` of the
+    current request. Nested blocks of the same phase are counted once.
+    """
+    timings = _timings.get()
+    if timings is None or phase in timings.active:
+        yield
+        return
+    timings.active.add(phase)
+    db_before = timings.db
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started - (timings.db - db_before)
+        setattr(timings, phase, getattr(timings, phase) + max(elapsed, 0.0))
+        timings.active.discard(phase)
+
+
+def record_query(execute, sql, params, many, context):
+    timings = _timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.db += time.perf_counter() - started
+        timings.queries += 1
+
+
+def install_query_timer(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def install_query_timers():
+    """Time queries on this thread's open connections; new ones get it from connection_created."""
+    for connection in connections.all(initialized_only=True):
+        install_query_timer(connection)
+
+
+connection_created.connect(install_query_timer, dispatch_uid='social_media_api.metrics')
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        # label -> [count per bucket (last one is +Inf)..., sum]
+        self.series = {}
+
+    def observe(self, label, value):
+        series = self.series.get(label)
+        if series is None:
+            series = self.series.setdefault(label, [0] * (len(self.buckets) + 1) + [0.0])
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+
+class Collector:
+    """A gauge or counter whose values `read()` returns as {label: value} when scraped."""
+
+    def __init__(self, name, help_text, kind, label_name, read):
+        self.name = name
+        self.help_text = help_text
+        self.kind = kind
+        self.label_name = label_name
+        self.read = read
+
+    def collect(self):
+        return {label: [value] for label, value in self.read().items()}
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.collectors = {}
+        self.flushed_at = 0.0
+
+    def histogram(self, name, help_text, buckets):
+        return self.histograms.setdefault(name, Histogram(name, help_text, buckets))
+
+    def collector(self, name, help_text, kind, label_name, read):
+        return self.collectors.setdefault(name, Collector(name, help_text, kind, label_name, read))
+
+    def snapshot(self):
+        with self.lock:
+            snapshot = {name: {label: list(series) for label, series in histogram.series.items()}
+                        for name, histogram in self.histograms.items()}
+        # Values of several processes are added up, like the histograms
+        for name, collector in self.collectors.items():
+            snapshot[name] = collector.collect()
+        return snapshot
+
+    def flush(self, directory):
+        """Write this process's snapshot to `directory`, atomically."""
+        path = os.path.join(directory, f'{os.getpid()}.json')
+        with open(f'{path}.tmp', 'w') as output:
+            json.dump(self.snapshot(), output)
+        os.replace(f'{path}.tmp', path)
+
+    def merged(self, directory=None):
+        """Snapshot of this process plus, with a directory, every process that flushed there."""
+        snapshots = []
+        if directory:
+            self.flush(directory)
+            # Gauges of processes that have not flushed for a while (exited
+            # or idle) are dropped; their counters and histograms still count
+            stale_before = time.time() - METRICS_FLUSH_INTERVAL * 12
+            for path in glob.glob(os.path.join(directory, '*.json')):
+                try:
+                    with open(path) as snapshot:
+                        snapshots.append((json.load(snapshot), os.path.getmtime(path) < stale_before))
+                except (OSError, ValueError):
+                    continue
+        else:
+            snapshots.append((self.snapshot(), False))
+        gauges = {name for name, collector in self.collectors.items() if collector.kind == 'gauge'}
+        merged = {}
+        for snapshot, stale in snapshots:
+            for name, series in snapshot.items():
+                if stale and name in gauges:
+                    continue
+                target = merged.setdefault(name, {})
+                for label, values in series.items():
+                    if label in target:
+                        target[label] = [a + b for a, b in zip(target[label], values)]
+                    else:
+                        target[label] = list(values)
+        return merged
+
+    def render(self, directory=None):
+        """Prometheus text exposition format."""
+        merged = self.merged(directory)
+        lines = []
+        for name, histogram in self.histograms.items():
+            lines.append(f'# HELP {name} {histogram.help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for label, series in sorted(merged.get(name, {}).items()):
+                view = label.replace('\\', '\\\\').replace('"', '\\"')
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + ('+Inf',), series):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_sum{{view="{view}"}} {series[-1]}')
+                lines.append(f'{name}_count{{view="{view}"}} {cumulative}')
+        for name, collector in self.collectors.items():
+            lines.append(f'# HELP {name} {collector.help_text}')
+            lines.append(f'# TYPE {name} {collector.kind}')
+            for label, (value,) in sorted(merged.get(name, {}).items()):
+                lines.append(f'{name}{{{collector.label_name}="{label}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+request_duration = registry.histogram(
+    'http_request_duration_seconds', 'Time until the response was returned', DURATION_BUCKETS)
+db_queries = registry.histogram('http_request_db_queries', 'SQL queries per request', QUERY_BUCKETS)
+db_duration = registry.histogram('http_request_db_duration_seconds', 'Time spent in SQL', DURATION_BUCKETS)
+serialize_duration = registry.histogram(
+    'http_request_serialize_duration_seconds', 'Time spent serializing, excluding SQL', DURATION_BUCKETS)
+render_duration = registry.histogram(
+    'http_request_render_duration_seconds', 'Time spent rendering the body, excluding SQL', DURATION_BUCKETS)
+response_size = registry.histogram('http_response_size_bytes', 'Size of non-streaming response bodies', SIZE_BUCKETS)
+
+
+def pool_stats():
+    """psycopg_pool statistics of every pooled database alias opened by this process."""
+    stats = {}
+    for alias in connections:
+        # .pool is only defined by the PostgreSQL backend and is None unless
+        # OPTIONS['pool'] is set
+        pool = getattr(connections[alias], 'pool', None)
+        if pool is not None:
+            stats[alias] = pool.get_stats()
+    return stats
+
+
+def _pool_reader(key, scale=1):
+    def read():
+        return {alias: stats.get(key, 0) * scale for alias, stats in pool_stats().items()}
+    return read
+
+
+# psycopg_pool only reports counters that are not zero
+for name, help_text, kind, key, scale in (
+    ('db_pool_size', 'Connections open in the pool, in use or idle', 'gauge', 'pool_size', 1),
+    ('db_pool_available', 'Idle connections in the pool', 'gauge', 'pool_available', 1),
+    ('db_pool_requests_waiting', 'Requests waiting for a connection right now', 'gauge', 'requests_waiting', 1),
+    ('db_pool_requests_total', 'Connections handed out by the pool', 'counter', 'requests_num', 1),
+    ('db_pool_requests_queued_total', 'Requests that had to wait for a connection', 'counter',
+     'requests_queued', 1),
+    ('db_pool_wait_seconds_total', 'Time requests spent waiting for a connection', 'counter',
+     'requests_wait_ms', 0.001),
+    ('db_pool_timeouts_total', 'Requests that timed out waiting for a connection', 'counter',
+     'requests_errors', 1),
+    ('db_pool_connections_total', 'Connections opened to the server', 'counter', 'connections_num', 1),
+    ('db_pool_connections_lost_total', 'Connections found broken by the health check', 'counter',
+     'connections_lost', 1),
+):
+    registry.collector(name, help_text, kind, 'alias', _pool_reader(key, scale))
+
+
+def observe(view, total, timings, size):
+    with registry.lock:
+        request_duration.observe(view, total)
+        db_queries.observe(view, timings.queries)
+        db_duration.observe(view, timings.db)
+        serialize_duration.observe(view, timings.serialize)
+        render_duration.observe(view, timings.render)
+        if size is not None:
+            response_size.observe(view, size)
+    if METRICS_DIR and time.monotonic() - registry.flushed_at >= METRICS_FLUSH_INTERVAL:
+        registry.flushed_at = time.monotonic()
+        registry.flush(METRICS_DIR)
+
+
+def server_timing(total, timings):
+    app = max(total - timings.db - timings.serialize - timings.render, 0.0)
+    return ', '.join([
+        f'db;dur={timings.db * 1000:.2f};desc="{timings.queries} queries"',
+        f'serialize;dur={timings.serialize * 1000:.2f}',
+        f'render;dur={timings.render * 1000:.2f}',
+        f'app;dur={app * 1000:.2f}',
+        f'total;dur={total * 1000:.2f}',
+    ])
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint, only answered for METRICS_ALLOWED_IPS."""
+    if request.META.get('REMOTE_ADDR') not in METRICS_ALLOWED_IPS:
+        raise Http404
+    return HttpResponse(registry.render(METRICS_DIR), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,128 @@
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.utils.functional import SimpleLazyObject, empty
+from whitenoise.middleware import WhiteNoiseMiddleware
+from rest_framework.permissions import SAFE_METHODS
+from . import metrics, replicas
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise with an async code path. WhiteNoiseMiddleware is sync-only,
+    which makes Django run every async view under ASGI in a worker thread,
+    so each idle streaming connection would hold a thread.
+    """
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
+
+
+class PerformanceMiddleware:
+    """
+    Records SQL, serialization and render time, query count and response
+    size for every request into the histograms served at /metrics, and
+    adds them as a Server-Timing header for staff users. Place it first.
+    """
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        metrics.install_query_timers()
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        metrics.install_query_timers()
+        token = metrics.start_request()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            timings = metrics.end_request(token)
+        return self.finish(request, response, time.perf_counter() - started, timings)
+
+    async def __acall__(self, request):
+        token = metrics.start_request()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            timings = metrics.end_request(token)
+        return self.finish(request, response, time.perf_counter() - started, timings)
+
+    def finish(self, request, response, total, timings):
+        match = request.resolver_match
+        view = (match.view_name or match.route) if match else 'unmatched'
+        size = None if response.streaming else len(response.content)
+        metrics.observe(view, total, timings, size)
+        if _is_staff(request):
+            response['Server-Timing'] = metrics.server_timing(total, timings)
+        return response
+
+
+class ReplicaPinMiddleware:
+    """
+    Pins users to the primary database for a short while after a successful
+    write, so replica lag never hides their own changes (see replicas.py).
+    """
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        response = self.get_response(request)
+        if self.should_pin(request, response):
+            replicas.pin_to_primary(_authenticated_user(request).pk)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if self.should_pin(request, response):
+            await sync_to_async(replicas.pin_to_primary)(_authenticated_user(request).pk)
+        return response
+
+    def should_pin(self, request, response):
+        return (replicas.get_replicas() and request.method not in SAFE_METHODS
+                and response.status_code < 400 and _authenticated_user(request) is not None)
+
+
+def _authenticated_user(request):
+    # Do not trigger a session lookup for a user nobody authenticated
+    user = getattr(request, 'user', None)
+    if isinstance(user, SimpleLazyObject) and user._wrapped is empty:
+        return None
+    return user if user is not None and user.is_authenticated else None
+
+
+def _is_staff(request):
+    return bool(getattr(_authenticated_user(request), 'is_staff', False))
@@ -0,0 +1,65 @@
+from rest_framework.pagination import BasePagination, CursorPagination, PageNumberPagination
+
+
+class StandardResultsSetPagination(PageNumberPagination):
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class StandardCursorPagination(CursorPagination):
+    # Keyset pagination on (created_at, id): no COUNT(*) and no OFFSET scan,
+    # and pages stay stable while new rows are inserted
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
+
+
+class UserDirectoryPagination(StandardCursorPagination):
+    # username is unique, so it is a stable cursor on its own
+    ordering = ('username',)
+
+
+class CursorOrPageNumberPagination(BasePagination):
+    """
+    Cursor pagination by default. Clients that need totals can opt into
+    numbered pages (with a count) by sending `?page=<n>`.
+    """
+    cursor_class = StandardCursorPagination
+    page_number_class = StandardResultsSetPagination
+
+    def __init__(self):
+        self.cursor_paginator = self.cursor_class()
+        self.page_number_paginator = self.page_number_class()
+        self.paginator = self.cursor_paginator
+
+    def uses_page_numbers(self, request):
+        return self.page_number_paginator.page_query_param in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.uses_page_numbers(request):
+            self.paginator = self.page_number_paginator
+        else:
+            self.paginator = self.cursor_paginator
+        return self.paginator.paginate_queryset(queryset, request, view=view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return self.cursor_paginator.get_paginated_response_schema(schema)
+
+    def get_schema_operation_parameters(self, view):
+        return (self.cursor_paginator.get_schema_operation_parameters(view)
+                + self.page_number_paginator.get_schema_operation_parameters(view)[:1])
+
+    def get_results(self, data):
+        return self.paginator.get_results(data)
+
+    def to_html(self):
+        return self.paginator.to_html()
+
+    @property
+    def display_page_controls(self):
+        return self.paginator.display_page_controls
@@ -0,0 +1,43 @@
+from urllib.parse import urlsplit
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+
+# The most SQL queries one request to a view may run, with a cold cache
+# and authentication excluded. Declare it as a `query_budget` attribute on
+# a view class or with @query_budget(n) on a function view; the test
+# suite sends every route through QueryBudgetTestMixin.
+
+
+def query_budget(max_queries):
+    """Declares the query budget of a view class or function view."""
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+    return decorator
+
+
+def get_query_budget(view):
+    """Budget of a resolved view (``resolve(path).func``), or None if it has none."""
+    # DRF's as_view() keeps the class on .cls, Django's on .view_class
+    for candidate in (getattr(view, 'cls', None), getattr(view, 'view_class', None), view):
+        budget = getattr(candidate, 'query_budget', None)
+        if budget is not None:
+            return budget
+    return None
+
+
+class QueryBudgetTestMixin:
+    """Test case helpers that fail when a request runs more queries than its view allows."""
+
+    def request_within_budget(self, method, path, **kwargs):
+        """Send a request with self.client and return (response, number of queries)."""
+        budget = get_query_budget(resolve(urlsplit(path).path).func)
+        if budget is None:
+            self.fail(f'{path} has no query budget')
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method.lower())(path, **kwargs)
+        if len(queries) > budget:
+            statements = '\n'.join(query['sql'] for query in queries.captured_queries)
+            self.fail(f'{method} {path} ran {len(queries)} queries, budget is {budget}:\n{statements}')
+        return response, len(queries)
@@ -0,0 +1,83 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import permissions
+
+# Read replicas. Views opt in with ReplicaReadMixin; their safe requests
+# read from one of DATABASE_REPLICAS unless the user wrote recently.
+# Everything else, and every write, uses `default`.
+#
+# Replicas lag behind the primary, so after a successful unsafe request
+# ReplicaPinMiddleware pins the user to the primary for
+# REPLICA_PIN_SECONDS: they always see their own writes.
+
+_read_alias = ContextVar('read_alias', default=None)
+
+
+def get_replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', ())
+
+
+def _pin_key(user_id):
+    return f'db:pinned:{user_id}'
+
+
+def pin_to_primary(user_id):
+    cache.set(_pin_key(user_id), True, getattr(settings, 'REPLICA_PIN_SECONDS', 10))
+
+
+def is_pinned(user_id):
+    return cache.get(_pin_key(user_id)) is not None
+
+
+@contextmanager
+def use_primary():
+    """Read from `default` inside the block, e.g. to fill a shared cache."""
+    token = _read_alias.set(None)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+class ReplicaRouter:
+    """Sends reads to the replica chosen for the current request, if any."""
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        databases = {'default', *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReplicaReadMixin:
+    """
+    Lets safe requests to `replica_actions` read from a replica. Names are
+    viewset actions ('list') or, for other views, handler methods ('get').
+    """
+    replica_actions = ()
+
+    def dispatch(self, request, *args, **kwargs):
+        token = _read_alias.set(None)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            _read_alias.reset(token)
+
+    def initial(self, request, *args, **kwargs):
+        # After authentication, so a pinned user can be recognized
+        super().initial(request, *args, **kwargs)
+        replicas = get_replicas()
+        action = getattr(self, 'action', None) or request.method.lower()
+        if (replicas and request.method in permissions.SAFE_METHODS and action in self.replica_actions
+                and not (request.user.is_authenticated and is_pinned(request.user.pk))):
+            _read_alias.set(random.choice(replicas))
@@ -43,19 +43,24 @@ INSTALLED_APPS = [
     'accounts',
     'posts',
     'notifications',
+    'loadtest',
 ]
 
 # Rest Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'accounts.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
         'rest_framework.filters.SearchFilter',
         'rest_framework.filters.OrderingFilter',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_RENDERER_CLASSES': [
+        'social_media_api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'social_media_api.pagination.CursorOrPageNumberPagination',
     'PAGE_SIZE': 10,
 }
 
@@ -63,8 +68,10 @@ REST_FRAMEWORK = {
 AUTH_USER_MODEL = 'accounts.User'
 
 MIDDLEWARE = [
+    'social_media_api.middleware.PerformanceMiddleware',
+    'social_media_api.middleware.ReplicaPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',  # Add Whitenoise middleware after security and before all others
+    'social_media_api.middleware.AsyncWhiteNoiseMiddleware',  # Add Whitenoise middleware after security and before all others
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -105,9 +112,27 @@ DATABASES = {
         'PASSWORD': '',
         'HOST': 'localhost',
         'PORT': '3306',
-    }
+    },
+    # Stand-in replica for ReplicaRoutingTests in social_media_api/tests.py,
+    # which route to it with override_settings. It is not listed in
+    # DATABASE_REPLICAS, so nothing else reads from it
+    'replica': {
+        'ENGINE': 'django.db.backends.mysql',
+        'NAME': 'social_media_db_replica',
+        'USER': 'root',
+        'PASSWORD': '',
+        'HOST': 'localhost',
+        'PORT': '3306',
+    },
 }
 
+# Aliases in DATABASES that safe feed, post list and notification list
+# requests may read from; see social_media_api/replicas.py
+DATABASE_REPLICAS = []
+DATABASE_ROUTERS = ['social_media_api.replicas.ReplicaRouter']
+# Seconds a user reads from the primary after writing
+REPLICA_PIN_SECONDS = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -159,3 +184,5 @@ SECURE_BROWSER_XSS_FILTER = True
 X_FRAME_OPTIONS = 'DENY'
 SECURE_CONTENT_TYPE_NOSNIFF = True
 SECURE_SSL_REDIRECT = True
+# Prometheus scrapes /metrics over plain HTTP from inside the network
+SECURE_REDIRECT_EXEMPT = [r'^metrics$']
@@ -1,5 +1,6 @@
 from .settings import *
 import os
+from django.core.exceptions import ImproperlyConfigured
 
 # Production Settings
 DEBUG = False
@@ -22,6 +23,61 @@ DATABASES = {
     }
 }
 
+# How connections are managed, DB_CONNECTION_MODE:
+#   pool        a psycopg 3 pool per worker process (default)
+#   pgbouncer   a transaction-level pooler such as PgBouncer does the reuse:
+#               no server-side cursors and no session state
+# The site is served through ASGI, where persistent connections
+# (CONN_MAX_AGE > 0) are not reused and leak, so neither mode keeps one.
+DB_CONNECTION_MODE = os.environ.get('DB_CONNECTION_MODE', 'pool')
+# Connections are checked before use and replaced if the server dropped them
+DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+if DB_CONNECTION_MODE == 'pool':
+    DATABASES['default']['OPTIONS'] = {'pool': {
+        'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+        'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+        # Seconds a request waits for a free connection before failing
+        'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        'max_idle': float(os.environ.get('DB_POOL_MAX_IDLE', 600)),
+        'max_lifetime': float(os.environ.get('DB_POOL_MAX_LIFETIME', 3600)),
+    }}
+elif DB_CONNECTION_MODE == 'pgbouncer':
+    # Connecting to a local pooler is cheap: close after each request
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    # Consecutive transactions may run on different server connections:
+    # .iterator() must not keep a cursor open across them. Prepared
+    # statements are already off unless OPTIONS['prepare_threshold'] is set
+    DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+else:
+    raise ImproperlyConfigured(f'Unknown DB_CONNECTION_MODE: {DB_CONNECTION_MODE}')
+
+# Streaming replicas of the primary, comma-separated host[:port]
+DATABASE_REPLICAS = []
+for index, replica in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(','))):
+    host, _, port = replica.strip().partition(':')
+    alias = f'replica_{index + 1}'
+    DATABASES[alias] = dict(DATABASES['default'], HOST=host, PORT=port or DATABASES['default']['PORT'],
+                            TEST={'MIRROR': 'default'})
+    DATABASE_REPLICAS.append(alias)
+
+# Token lookups, unread counts, following sets, post bodies and replica pins
+# are cached; every web and worker process must share the cache to see the
+# others' writes and invalidations. CACHE_URL is redis[s]://... or
+# memcached://host:port; Heroku Redis sets REDIS_URL
+CACHE_URL = os.environ.get('CACHE_URL') or os.environ.get('REDIS_URL')
+if CACHE_URL:
+    scheme, _, location = CACHE_URL.partition('://')
+    if scheme in ('redis', 'rediss'):
+        CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': CACHE_URL}}
+    elif scheme == 'memcached':
+        CACHES = {'default': {'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache', 'LOCATION': location}}
+    else:
+        raise ImproperlyConfigured(f'Unsupported CACHE_URL scheme: {scheme}')
+elif not DEBUG:
+    # A per-process LocMem cache would let a revoked token, a stale following
+    # set or a stale post body live on in the other processes for minutes
+    raise ImproperlyConfigured('Set CACHE_URL or REDIS_URL to a cache shared by all processes')
+
 # Security Settings
 SECURE_SSL_REDIRECT = True
 SESSION_COOKIE_SECURE = True
@@ -64,8 +120,10 @@ LOGGING = {
 }
 
 MIDDLEWARE = [
+    'social_media_api.middleware.PerformanceMiddleware',
+    'social_media_api.middleware.ReplicaPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',  # Add this after security middleware
+    'social_media_api.middleware.AsyncWhiteNoiseMiddleware',  # Add this after security middleware
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
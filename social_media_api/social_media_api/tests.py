@@ -0,0 +1,405 @@
+import importlib
+import json
+import os
+import tempfile
+from unittest import skipUnless
+from unittest.mock import patch
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, override_settings
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from accounts.follows import follow
+from notifications.models import Notification
+from posts.feed import backfill_feed
+from posts.counters import reconcile_post_counters
+from posts.models import Comment, Like, Post
+from posts.views import FeedView, PostViewSet
+from . import metrics
+from .query_budget import QueryBudgetTestMixin
+
+User = get_user_model()
+
+PAGE = 100
+
+
+def route_names(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from route_names(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            yield pattern.name
+
+
+class QueryBudgetTests(QueryBudgetTestMixin, APITestCase):
+    """
+    Sends every route of the API through its query budget, once with one
+    item and once with a full page of them. A route may not run more
+    queries for the full page: that is an N+1.
+    """
+    urlconfs = ('accounts.urls', 'posts.urls', 'notifications.urls')
+    # An endless response; its queries run per pushed event, not per request
+    skipped = {'notification-stream'}
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='reader', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.created = 0
+
+    def make_users(self, n):
+        start, self.created = self.created, self.created + n
+        return User.objects.bulk_create([User(username=f'user{i}') for i in range(start, start + n)])
+
+    def make_posts(self, n, author=None, comments=2):
+        author = author or self.make_users(1)[0]
+        posts = Post.objects.bulk_create([Post(author=author, title=f'Post {i}', content='Text') for i in range(n)])
+        commenters = self.make_users(comments)
+        Comment.objects.bulk_create([
+            Comment(post=post, author=commenter, content='Reply') for post in posts for commenter in commenters
+        ])
+        Like.objects.bulk_create([Like(post=post, user=commenter) for post in posts for commenter in commenters])
+        reconcile_post_counters(Post.objects.filter(pk__in=[post.pk for post in posts]))
+        return posts
+
+    def make_notifications(self, n):
+        posts = self.make_posts(n, comments=1)
+        post_type = ContentType.objects.get_for_model(Post)
+        comment_type = ContentType.objects.get_for_model(Comment)
+        actors = self.make_users(2)
+        # Half of them target comments, so both target types are loaded
+        return Notification.objects.bulk_create([
+            Notification(recipient=self.user, actor=actors[i % 2], verb='liked',
+                         target_content_type=post_type, target_object_id=post.pk)
+            if i % 2 == 0 else
+            Notification(recipient=self.user, actor=actors[i % 2], verb='commented on',
+                         target_content_type=comment_type, target_object_id=post.comments.first().pk)
+            for i, post in enumerate(posts)
+        ])
+
+    # One method per route name: create n items, return the requests to send
+
+    def route_api_root(self, n):
+        return [('GET', reverse('api-root'), {})]
+
+    def route_post_list(self, n):
+        self.make_posts(n)
+        return [
+            ('GET', f"{reverse('post-list')}?page_size={n}", {}),
+            ('GET', f"{reverse('post-list')}?page_size={n}&page=1", {}),
+            ('GET', f"{reverse('post-list')}?page_size={n}&q=post", {}),
+            ('POST', reverse('post-list'), {'data': {'title': 'New', 'content': 'Post'}}),
+        ]
+
+    def route_post_detail(self, n):
+        post = self.make_posts(1, author=self.user, comments=n)[0]
+        path = reverse('post-detail', kwargs={'pk': post.pk})
+        return [('GET', f'{path}?comments=20', {}), ('PATCH', path, {'data': {'title': 'Edited'}}), ('DELETE', path, {})]
+
+    def route_comment_list(self, n):
+        post = self.make_posts(1, comments=n)[0]
+        return [
+            ('GET', f"{reverse('comment-list')}?post={post.pk}&page_size={n}", {}),
+            ('POST', reverse('comment-list'), {'data': {'post': post.pk, 'content': 'Hi'}}),
+        ]
+
+    def route_comment_detail(self, n):
+        post = self.make_posts(1, comments=n)[0]
+        comment = Comment.objects.create(post=post, author=self.user, content='Mine')
+        path = reverse('comment-detail', kwargs={'pk': comment.pk})
+        return [('GET', path, {}), ('PATCH', path, {'data': {'content': 'Edited'}}), ('DELETE', path, {})]
+
+    def route_feed(self, n):
+        author = self.make_users(1)[0]
+        self.make_posts(n, author=author)
+        follow(self.user, author)
+        backfill_feed(self.user, author)
+        return [('GET', f"{reverse('feed')}?page_size={n}", {})]
+
+    def route_post_like(self, n):
+        post = self.make_posts(1, comments=n)[0]
+        path = reverse('post-like', kwargs={'pk': post.pk})
+        return [('POST', path, {}), ('POST', path, {}), ('DELETE', path, {}), ('DELETE', path, {})]
+
+    def route_post_unlike(self, n):
+        post = self.make_posts(1, comments=n)[0]
+        Like.objects.create(post=post, user=self.user)
+        return [('POST', reverse('post-unlike', kwargs={'pk': post.pk}), {})]
+
+    def route_like_batch(self, n):
+        posts = self.make_posts(n, comments=1)
+        return [
+            ('POST', reverse('like-batch'), {'data': {'actions': [
+                {'post': post.pk, 'action': action} for post in posts
+            ]}, 'format': 'json'})
+            for action in ('like', 'unlike')
+        ]
+
+    def route_user_list(self, n):
+        self.make_users(n)
+        return [('GET', f"{reverse('user-list')}?page_size={n}", {}),
+                ('GET', f"{reverse('user-list')}?page_size={n}&q=user", {})]
+
+    def route_register(self, n):
+        return [('POST', reverse('register'), {'data': {
+            'username': f'newcomer{n}', 'email': f'newcomer{n}@example.com', 'password': 'c0mplex-Pass',
+            'password2': 'c0mplex-Pass',
+        }})]
+
+    def route_login(self, n):
+        return [('POST', reverse('login'), {'data': {'username': 'reader', 'password': 'testpass123'}})]
+
+    def route_profile(self, n):
+        for followee in self.make_users(n):
+            follow(self.user, followee)
+        return [('GET', reverse('profile'), {}), ('PATCH', reverse('profile'), {'data': {'bio': 'Hello'}})]
+
+    def route_follow_batch(self, n):
+        users = self.make_users(n)
+        for user in users:
+            self.make_posts(1, author=user, comments=0)
+        return [('POST', reverse('follow-batch'), {'data': {'user_ids': [u.pk for u in users]}, 'format': 'json'})]
+
+    def route_unfollow_batch(self, n):
+        users = self.make_users(n)
+        for user in users:
+            follow(self.user, user)
+        return [('POST', reverse('unfollow-batch'), {'data': {'user_ids': [u.pk for u in users]}, 'format': 'json'})]
+
+    def route_follow_user(self, n):
+        author = self.make_users(1)[0]
+        self.make_posts(n, author=author, comments=0)
+        return [('POST', reverse('follow-user', kwargs={'user_id': author.pk}), {})]
+
+    def route_unfollow_user(self, n):
+        author = self.make_users(1)[0]
+        self.make_posts(n, author=author, comments=0)
+        follow(self.user, author)
+        backfill_feed(self.user, author)
+        return [('POST', reverse('unfollow-user', kwargs={'user_id': author.pk}), {})]
+
+    def route_notification_list(self, n):
+        self.make_notifications(max(n, 2))
+        # At least two, so both target types are expanded
+        return [('GET', f"{reverse('notification-list')}?page_size={n}", {}),
+                ('GET', f"{reverse('notification-list')}?page_size={max(n, 2)}&expand=target", {})]
+
+    def route_notification_poll(self, n):
+        self.make_notifications(n)
+        since = (timezone.now() - timezone.timedelta(minutes=1)).isoformat()
+        return [('GET', reverse('notification-poll'), {'data': {'since': since, 'timeout': 0}})]
+
+    def route_unread_count(self, n):
+        self.make_notifications(n)
+        return [('GET', reverse('unread-count'), {})]
+
+    def route_mark_all_read(self, n):
+        self.make_notifications(n)
+        return [('POST', reverse('mark-all-read'), {})]
+
+    def route_mark_read(self, n):
+        notification = self.make_notifications(n)[0]
+        return [('POST', reverse('mark-read', kwargs={'pk': notification.pk}), {})]
+
+    def measure(self, name, n):
+        counts = []
+        for method, path, kwargs in getattr(self, f"route_{name.replace('-', '_')}")(n):
+            # Cold cache: the budget is the worst case, not the cached path
+            cache.clear()
+            response, queries = self.request_within_budget(method, path, **kwargs)
+            self.assertLess(response.status_code, 400, f'{method} {path}')
+            counts.append(queries)
+        return counts
+
+    def check_route(self, name):
+        with self.subTest(route=name):
+            single = self.measure(name, 1)
+            page = self.measure(name, PAGE)
+            for one, many in zip(single, page):
+                self.assertLessEqual(many, one, f'{name}: {many} queries for {PAGE} items, {one} for 1')
+
+    def test_every_route_is_exercised(self):
+        names = {name for urlconf in self.urlconfs for name in route_names(get_resolver(urlconf).url_patterns)}
+        missing = {name for name in names - self.skipped if not hasattr(self, f"route_{name.replace('-', '_')}")}
+        self.assertFalse(missing, f'Routes without a query budget test: {sorted(missing)}')
+
+    def test_routes_stay_within_budget(self):
+        for urlconf in self.urlconfs:
+            for name in dict.fromkeys(route_names(get_resolver(urlconf).url_patterns)):
+                if name not in self.skipped:
+                    self.check_route(name)
+
+    def test_serializer_path_stays_within_budget(self):
+        # The ModelSerializer fallback of the post lists
+        with patch.object(PostViewSet, 'fast_serialization', False), \
+                patch.object(FeedView, 'fast_serialization', False):
+            for name in ('post-list', 'feed'):
+                self.check_route(name)
+
+
+class PerformanceMiddlewareTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='member', password='testpass123')
+        self.staff = User.objects.create_user(username='staff', password='testpass123', is_staff=True)
+        Post.objects.create(author=self.user, title='Hello', content='World')
+
+    def test_server_timing_is_only_sent_to_staff(self):
+        self.client.force_authenticate(user=self.user)
+        self.assertNotIn('Server-Timing', self.client.get(reverse('post-list'), {'author': self.user.pk}))
+
+        self.client.force_authenticate(user=self.staff)
+        timing = self.client.get(reverse('post-list'), {'author': self.user.pk})['Server-Timing']
+        for phase in ('db;dur=', 'serialize;dur=', 'render;dur=', 'app;dur=', 'total;dur='):
+            self.assertIn(phase, timing)
+        self.assertRegex(timing, r'desc="[1-9]\d* queries"')
+
+    def test_metrics_are_aggregated_per_url_name(self):
+        self.client.force_authenticate(user=self.user)
+        before = sum(metrics.request_duration.series.get('post-list', [0, 0])[:-1])
+        self.client.get(reverse('post-list'))
+        self.client.get(reverse('post-list'))
+
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('# TYPE http_request_duration_seconds histogram', body)
+        count = sum(metrics.request_duration.series['post-list'][:-1])
+        self.assertEqual(count, before + 2)
+        self.assertIn(f'http_request_duration_seconds_count{{view="post-list"}} {count}', body)
+        self.assertIn('http_request_db_queries_bucket{view="post-list",le="+Inf"}', body)
+        self.assertIn('http_response_size_bytes_count{view="post-list"}', body)
+
+    def test_metrics_are_not_served_to_remote_addresses(self):
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='203.0.113.9')
+        self.assertEqual(response.status_code, 404)
+
+    def test_snapshots_of_several_processes_are_added_up(self):
+        with tempfile.TemporaryDirectory() as directory:
+            other = metrics.Registry()
+            other.histogram('http_request_db_queries', 'SQL queries per request', metrics.QUERY_BUCKETS)
+            other.histograms['http_request_db_queries'].observe('feed', 3)
+            with open(os.path.join(directory, 'other.json'), 'w') as snapshot:
+                json.dump(other.snapshot(), snapshot)
+            local = metrics.Registry()
+            local.histogram('http_request_db_queries', 'SQL queries per request', metrics.QUERY_BUCKETS)
+            local.histograms['http_request_db_queries'].observe('feed', 2)
+
+            body = local.render(directory)
+        self.assertIn('http_request_db_queries_count{view="feed"} 2', body)
+        self.assertIn('http_request_db_queries_sum{view="feed"} 5.0', body)
+        self.assertIn('http_request_db_queries_bucket{view="feed",le="2"} 1', body)
+
+
+@skipUnless('replica' in settings.DATABASES, 'needs a second database aliased "replica"')
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(APITestCase):
+    """The "replica" database never receives the test's writes, like a replica far behind."""
+    # The runner sets up every alias a test class names, skipped classes included
+    databases = {'default', 'replica'} if 'replica' in settings.DATABASES else {'default'}
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author', password='testpass123')
+        self.reader = User.objects.create_user(username='reader', password='testpass123')
+        self.post = Post.objects.create(author=self.author, title='Hello', content='World')
+        follow(self.reader, self.author)
+        backfill_feed(self.reader, self.author)
+        Notification.objects.create(recipient=self.reader, actor=self.author, verb='liked',
+                                    target_content_type=ContentType.objects.get_for_model(Post),
+                                    target_object_id=self.post.pk)
+        self.client.force_authenticate(user=self.reader)
+
+    def test_opted_in_reads_use_the_replica(self):
+        self.assertEqual(self.client.get(reverse('feed')).data['results'], [])
+        self.assertEqual(self.client.get(reverse('notification-list')).data['results'], [])
+        self.assertEqual(self.client.get(reverse('post-list'), {'ordering': 'created_at'}).data['results'], [])
+
+    def test_other_requests_use_the_primary(self):
+        self.assertEqual(self.client.get(reverse('post-detail', kwargs={'pk': self.post.pk})).status_code, 200)
+        self.assertEqual(self.client.get(reverse('profile')).data['following_count'], 1)
+
+    def test_cached_post_list_is_filled_from_the_primary(self):
+        # Cached pages and bodies are shared, so they must not come from a lagging replica
+        response = self.client.get(reverse('post-list'))
+        self.assertEqual([post['id'] for post in response.data['results']], [self.post.pk])
+
+    def test_writes_pin_the_user_to_the_primary(self):
+        response = self.client.post(reverse('post-like', kwargs={'pk': self.post.pk}))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([post['id'] for post in self.client.get(reverse('feed')).data['results']], [self.post.pk])
+
+        # Only the writer is pinned
+        self.client.force_authenticate(user=self.author)
+        self.assertEqual(self.client.get(reverse('post-list'), {'ordering': 'created_at'}).data['results'], [])
+
+    def test_failed_writes_do_not_pin(self):
+        self.client.post(reverse('post-like', kwargs={'pk': self.post.pk + 100}))
+        self.assertEqual(self.client.get(reverse('feed')).data['results'], [])
+
+
+class ConnectionSettingsTests(SimpleTestCase):
+    def load(self, **environ):
+        with patch.dict(os.environ, dict({'CACHE_URL': 'redis://cache.internal:6379/0'}, **environ)):
+            from . import settings_prod
+            return importlib.reload(settings_prod).DATABASES
+
+    def test_pool_mode_is_the_default(self):
+        databases = self.load(DB_POOL_MAX_SIZE='4', DB_REPLICA_HOSTS='replica.internal:6432')
+        self.assertEqual(databases['default']['OPTIONS']['pool']['max_size'], 4)
+        self.assertTrue(databases['default']['CONN_HEALTH_CHECKS'])
+        # Pooling and persistent connections exclude each other
+        self.assertNotIn('CONN_MAX_AGE', databases['default'])
+        self.assertEqual(databases['replica_1']['OPTIONS'], databases['default']['OPTIONS'])
+        self.assertEqual(databases['replica_1']['PORT'], '6432')
+
+    def test_pgbouncer_mode_avoids_session_state(self):
+        databases = self.load(DB_CONNECTION_MODE='pgbouncer', DB_CONN_MAX_AGE='30')
+        # Persistent connections leak under ASGI; the pooler does the reuse
+        self.assertEqual(databases['default']['CONN_MAX_AGE'], 0)
+        self.assertTrue(databases['default']['DISABLE_SERVER_SIDE_CURSORS'])
+        self.assertNotIn('OPTIONS', databases['default'])
+
+    def test_persistent_mode_is_rejected(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.load(DB_CONNECTION_MODE='persistent')
+
+    def test_pool_statistics_are_exported(self):
+        stats = {'default': {'pool_size': 3, 'pool_available': 1, 'requests_num': 40, 'requests_wait_ms': 250}}
+        with patch.object(metrics, 'pool_stats', return_value=stats):
+            body = metrics.registry.render()
+        self.assertIn('# TYPE db_pool_size gauge', body)
+        self.assertIn('db_pool_size{alias="default"} 3', body)
+        self.assertIn('db_pool_requests_total{alias="default"} 40', body)
+        self.assertIn('db_pool_wait_seconds_total{alias="default"} 0.25', body)
+        # Counters psycopg_pool has not reported yet are zero
+        self.assertIn('db_pool_timeouts_total{alias="default"} 0', body)
+
+
+class CacheSettingsTests(SimpleTestCase):
+    def load(self, **environ):
+        with patch.dict(os.environ, environ):
+            from . import settings_prod
+            return importlib.reload(settings_prod).CACHES['default']
+
+    def test_cache_url_selects_a_shared_backend(self):
+        self.assertEqual(self.load(CACHE_URL='redis://cache.internal:6379/0'), {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': 'redis://cache.internal:6379/0',
+        })
+        self.assertEqual(self.load(CACHE_URL='memcached://cache.internal:11211'), {
+            'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+            'LOCATION': 'cache.internal:11211',
+        })
+        self.assertEqual(self.load(REDIS_URL='rediss://heroku.internal:6380')['LOCATION'],
+                         'rediss://heroku.internal:6380')
+
+    def test_production_refuses_a_per_process_cache(self):
+        with patch.dict(os.environ), self.assertRaises(ImproperlyConfigured):
+            os.environ.pop('CACHE_URL', None)
+            os.environ.pop('REDIS_URL', None)
+            self.load()